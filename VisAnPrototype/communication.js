@@ -13,8 +13,62 @@ const handleErrors = function(func) {
 }
 
 // INBOUND
-qgisplugin.aerialsLoaded.connect(handleErrors(function(_aerials) {
-    console.log(JSON.stringify(_aerials, null, 4));
+
+// Aerials arrive as JSON: a snapshot with one array per column, and then deltas. See web_protocol.py
+const aerialsProtocol = 1;
+let aerialsRevision = -1;
+
+qgisplugin.aerialsSnapshot.connect(handleErrors(function(json) {
+    const snapshot = JSON.parse(json);
+    if (snapshot.protocol !== aerialsProtocol) {
+        console.error("Unsupported protocol of aerials: " + snapshot.protocol);
+        return;
+    }
+    aerialsRevision = snapshot.revision;
+    const columns = snapshot.columns;
+    const metaNames = Object.keys(snapshot.meta);
+    const _aerials = columns.id.map( (id, i) => {
+        let meta = {};
+        metaNames.forEach( name => meta[name] = snapshot.meta[name][i]);
+        return {
+            id: id,
+            usage: columns.usage[i],
+            trafoLocked: columns.trafoLocked[i],
+            path: columns.path[i],
+            availability: columns.availability[i],
+            footprint: toFootprint(columns.footprint.slice(8*i, 8*i+8)),
+            meta: meta
+        };
+    });
+    aerialsLoaded(_aerials);
+}));
+
+qgisplugin.aerialsDelta.connect(handleErrors(function(json) {
+    const delta = JSON.parse(json);
+    if (delta.protocol !== aerialsProtocol || delta.base !== aerialsRevision) {
+        // Missed one.
+        aerialsRevision = -1;
+        qgisplugin.requestAerialsSnapshot();
+        return;
+    }
+    aerialsRevision = delta.revision;
+    Object.keys(delta.changes).forEach( imgId => {
+        const changes = delta.changes[imgId];
+        if (changes.footprint !== undefined) aerialFootPrintChanged(imgId, toFootprint(changes.footprint));
+        if (changes.availability !== undefined) aerialAvailabilityChanged(imgId, changes.availability, changes.path);
+        if (changes.usage !== undefined) aerialUsageChanged(imgId, changes.usage);
+    });
+}));
+
+// x0, y0, x1, y1, ... -> [{x: x0, y: y0}, ...]
+const toFootprint = function (coords) {
+    let footprint = [];
+    for (let i = 0; i < coords.length; i += 2) footprint.push({x: coords[i], y: coords[i+1]});
+    return footprint;
+}
+
+const aerialsLoaded = function(_aerials) {
+    console.log("Aerials loaded: " + _aerials.length);
     aerials = _aerials.sort( (a,b) => a.meta.Datum > b.meta.Datum).filter( a => a.footprint);
     aerialDates = aerials.map( a => a.meta.Datum).filter(onlyUnique);
     currentTimebin = '';
@@ -24,7 +78,7 @@ qgisplugin.aerialsLoaded.connect(handleErrors(function(_aerials) {
         attackDates = attackDates.filter( a => Date.parse("1945-01-01") < Date.parse(a) );
         aerialDates = aerialDates.filter( a => Date.parse("1945-01-01") < Date.parse(a) );
     }
-}));
+}
   
 qgisplugin.attackDataLoaded.connect(handleErrors(function(_attackData){
     console.log("Attack data: " + JSON.stringify(_attackData, null, 4));
@@ -197,7 +251,7 @@ qgisplugin.areaOfInterestLoaded.connect(handleErrors(function(_aoi){
     // resetSketch();
 }));
   
-qgisplugin.aerialFootPrintChanged.connect(handleErrors(function(imgId, _footprint) {
+const aerialFootPrintChanged = function(imgId, _footprint) {
     // console.log("Footprint of " + imgId + " has changed to " + JSON.stringify(_footprint, null, 4));
     footprints[imgId] = _footprint;
     let a = aerials.find( a => a.id === imgId);
@@ -212,14 +266,14 @@ qgisplugin.aerialFootPrintChanged.connect(handleErrors(function(imgId, _footprin
     
     // guidance.timer = 50;
     guidance.reconsider(a); 
-}));
+}
   
-qgisplugin.aerialAvailabilityChanged.connect(handleErrors(function(imgId, _availability, path){
+const aerialAvailabilityChanged = function(imgId, _availability, path){
     console.log("Availability of " + imgId + " has changed to: " + _availability + " with file path: " + path);
     // availability[imgId] = _availability;
-}));
+}
 
-qgisplugin.aerialUsageChanged.connect(handleErrors(function(imgId, usage){
+const aerialUsageChanged = function(imgId, usage){
     console.log("Usage of " + imgId + " has changed to " + usage);
     let aerial = aerials.find( a => a.id === imgId);
     if (usage==2) userSelect(aerial);
@@ -227,7 +281,7 @@ qgisplugin.aerialUsageChanged.connect(handleErrors(function(imgId, usage){
     else if (usage==0) userDiscard(aerial);
     // Trigger Guidance behaviour
     // guidance.reconsider(aerial);
-}));
+}
 
 
   
@@ -21,14 +21,17 @@ This script initializes the plugin, making it known to QGIS.
 """
 from __future__ import annotations
 
-from qgis.gui import QgisInterface
-
 import enum
 import logging
 from pathlib import Path
 import shutil
 import sys
 import tempfile
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Not at run time, so the command line interface can import this package without QGIS.
+    from qgis.gui import QgisInterface
 
 class Config(enum.Enum):
     # WMTS opens a WMS dataset for each overview level, passing timeout as option.
@@ -43,6 +46,10 @@ class Config(enum.Enum):
     # tempfile.gettempdir() yields C:\Users\<user>\AppData\Local\Temp\ on Windows 10.
     gdalCachePath = str(Path(tempfile.gettempdir()) / 'gdalwmscache')
 
+    # Maximum number of aerial and preview datasets to keep open across reads, summed over all threads.
+    # Each one holds at least one file descriptor, and the C runtime on Windows limits them to 512 by default.
+    maxOpenDatasets = 64
+
 
 _logger: logging.Logger | None = None
 _logFileHandler: logging.FileHandler | None = None
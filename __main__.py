@@ -0,0 +1,28 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Run the command line interface: python -m selorecon --help
+"""
+import sys
+
+from .cli import main
+
+# Worker processes import this module, too, but must not run main.
+if __name__ == '__main__':
+    sys.exit(main())
@@ -45,28 +45,32 @@ However, this sounds slow.
 """
 from __future__ import annotations
 
-from qgis.PyQt.QtCore import pyqtSlot, QEvent, QObject, QPointF, QSize, QRect, Qt
-from qgis.PyQt.QtGui import QBitmap, QBrush, QColor, QCursor, QFocusEvent, QHelpEvent, QIcon, QImage, QKeyEvent, QPen, QPainter, QPixmap, QTransform
-from qgis.PyQt.QtWidgets import (QDialog, QGraphicsEffect, QGraphicsEllipseItem, QGraphicsItem, QGraphicsLineItem, QGraphicsPixmapItem,
-                                 QGraphicsSceneContextMenuEvent, QGraphicsSceneMouseEvent,
+from qgis.PyQt.QtCore import QEvent, QObject, QPointF, QSize, QSizeF, QRect, QRectF, Qt
+from qgis.PyQt.QtGui import QBrush, QColor, QCursor, QFocusEvent, QHelpEvent, QIcon, QImage, QKeyEvent, QPen, QPainter, QPainterPath, QPixmap, QTransform
+from qgis.PyQt.QtWidgets import (QDialog, QGraphicsEllipseItem, QGraphicsItem, QGraphicsLineItem, QGraphicsPixmapItem,
+                                 QGraphicsSceneContextMenuEvent, QGraphicsSceneHoverEvent, QGraphicsSceneMouseEvent,
                                  QGraphicsSceneWheelEvent, QMenu, QMessageBox, QStyle, QStyleOptionGraphicsItem, QWhatsThis, QWidget)
 
 import numpy as np
 from osgeo import gdal
 
+import collections
 from concurrent import futures
-import datetime
 import enum
-import json
 import logging
+import math
 from pathlib import Path
-import sqlite3
 import threading
 from typing import cast, Final
 import weakref
 
 from . import GdalPushLogHandler
-from .preview_window import claheAvailable, ContrastEnhancement, enhanceContrast, PreviewWindow
+from .aerial_table import AerialTable, Clusters, PointClusters
+from .dataset_pool import datasetPool
+from .fs_index import FileIndex
+from .preview_window import ContrastEnhancement, enhanceContrast, PreviewWindow
+from . import project_db
+from .project_db import PreviewRect, Usage
 from . import map_scene
 from .georef import georef
 
@@ -89,12 +93,6 @@ class Availability(enum.IntEnum):
     image = QColor(238, 195, 59)  # Qt.yellow
 
 
-class Usage(enum.IntEnum):
-    discarded = 0
-    unset = 1
-    selected = 2
-
-
 class TransformState(enum.IntEnum):
     def __new__(cls, penStyle: Qt.PenStyle):
         value = len(cls.__members__)
@@ -116,91 +114,105 @@ class Visualization(enum.Enum):
     asImage = enum.auto()
 
 
-class InversionEffect(QGraphicsEffect):
-    def draw(self, painter):
-        pixmap, offset = self.sourcePixmap(Qt.DeviceCoordinates)
-        img = pixmap.toImage()
-        img.invertPixels()
-        painter.setWorldTransform(QTransform())
-        painter.drawPixmap(offset, QPixmap.fromImage(img))
+# Of aerials shown as points, on screen [px].
+_pointRadius: Final = 7
 
 
 class AerialObject(QObject):
 
-    __timerId: int | None = None
+    # Highlighted aerials blink in sync, driven by the scene's clock.
+    __animated = False
 
-    def __init__(self, scene: map_scene.MapScene, posScene: QPointF, imgId: str, meta, db: sqlite3.Connection):
+    def __init__(self, scene: map_scene.MapScene, table: AerialTable, row: int):
         super().__init__()
+        self.row: Final = row
+        self.__table: Final = table
         point = AerialPoint()
-        image = AerialImage(imgId, posScene, meta, point, db, self)
+        image = AerialImage(table, row, point, self, scene.contrastEnhancement())
         self.__point: Final = weakref.ref(point)
         self.image: Final = weakref.ref(image)
         point.setImage(image)
+        # Items start out visible. Hide the image first, so showing it requests its pixmap.
         image.setVisible(False)
+        self.syncVisibility()
         scene.contrastEnhancementChanged.connect(image.setContrastEnhancement)
-        scene.visualizationChanged.connect(self.__setVisualization)
-        scene.highlightAerials.connect(self.__highlight)
-        scene.showAsImage.connect(self.__showAsImage)
-        toolTip = [f'<tr><td>{name}</td><td>{value}</td></tr>' for name, value in meta._asdict().items()]
-        toolTip = ''.join(['<table>'] + toolTip + ['</table>'])
         for el in point, image:
-            el.setToolTip(toolTip)
-            effect = InversionEffect()
-            effect.setEnabled(False)
-            el.setGraphicsEffect(effect)
             # Add the items to the scene only now, such that they have not emitted scene signals during their setup.
             scene.addItem(el)
+        if scene.isHighlighted(image.id()):
+            # Highlighted before this aerial came close to the viewport.
+            self.__startAnimation()
+
+    def toolTip(self) -> str:
+        # Formatted only when asked for by the scene, as most aerials never show their tool tip.
+        meta = self.__table.metas[self.row]
+        toolTip = [f'<tr><td>{name}</td><td>{value}</td></tr>' for name, value in meta._asdict().items()]
+        return ''.join(['<table>'] + toolTip + ['</table>'])
 
-    def timerEvent(self, event) -> None:
+    def isAnimated(self) -> bool:
+        return self.__animated
+
+    def updateItems(self) -> None:
+        # Called by the scene to blink.
         for item in (self.image(), self.__point()):
             if item:
-                if effect := item.graphicsEffect():
-                    effect.setEnabled(not effect.isEnabled())
+                item.update()
 
-    # end of overrides
+    def isPinned(self) -> bool:
+        # Must not be released, even if far from the viewport.
+        return self.isAnimated() or any(item and item.hasFocus() for item in (self.image(), self.__point()))
 
-    def isAnimated(self) -> bool:
-        return self.__timerId is not None
+    def release(self) -> None:
+        """Remove the items from the scene, which deletes them. The aerial lives on in the table."""
+        self.__stopAnimation()
+        image, point = self.image(), self.__point()
+        if image is None or point is None:
+            return
+        scene = image.scene()
+        scene.contrastEnhancementChanged.disconnect(image.setContrastEnhancement)
+        image.release()
+        for el in point, image:
+            scene.removeItem(el)
 
-    @pyqtSlot(dict, dict, set)
-    def __setVisualization(self, usages: dict[Usage, bool], visualizations: dict[Availability, Visualization], filteredImageIds: set[str]):
+    def syncVisibility(self) -> None:
         if image := self.image():
-            usageIsOn = usages.get(image.usage())
-            visualization = visualizations.get(image.availability())
-            if usageIsOn is None or visualization is None:
-                return
-            isFiltered = not filteredImageIds or image.id() in filteredImageIds
-            image.setVisible(visualization == Visualization.asImage and usageIsOn and isFiltered)
-            if point := self.__point():
-                point.setVisible(visualization == Visualization.asPoint and usageIsOn and isFiltered)
-
-    @pyqtSlot(set)
-    def __highlight(self, imgIds) -> None:
-        image = self.image()
-        if image and image.id() in imgIds:
-            for item in (image, self.__point()):
+            image.setVisible(bool(self.__table.imageVisible[self.row]))
+        if point := self.__point():
+            point.setVisible(bool(self.__table.pointVisible[self.row]))
+
+    def storeVisibility(self, item: AerialImage | AerialPoint, visible: bool) -> None:
+        # Called by the items when shown or hidden.
+        column = self.__table.imageVisible if isinstance(item, AerialImage) else self.__table.pointVisible
+        if column[self.row] != visible:
+            column[self.row] = visible
+            if scene := item.scene():
+                scene.addAerialsVisible.emit(1 if visible else -1)
+
+    def setHighlighted(self, highlighted: bool) -> None:
+        # Called by the scene for the aerials highlighted now, and for those highlighted before.
+        if highlighted:
+            for item in (self.image(), self.__point()):
                 if item and item.isVisible():
                     item.setFocus()
-            # animate
-            if self.__timerId is None:
-                self.__timerId = self.startTimer(500)
-                self.__updateZValues()
+            self.__startAnimation()
         else:
-            # stop animation
-            if self.__timerId is not None:
-                self.killTimer(self.__timerId)
-                self.__timerId = None
-                for item in (image, self.__point()):
-                    if item:
-                        if effect := item.graphicsEffect():
-                            effect.setEnabled(False)
-                self.__updateZValues()
-
-    @pyqtSlot(str, bool)
-    def __showAsImage(self, imgId, show) -> None:
+            self.__stopAnimation()
+
+    def __startAnimation(self) -> None:
+        if not self.__animated:
+            self.__animated = True
+            self.__updateZValues()
+
+    def __stopAnimation(self) -> None:
+        if self.__animated:
+            self.__animated = False
+            self.updateItems()
+            self.__updateZValues()
+
+    def showAsImage(self, show: bool) -> None:
         image = self.image()
         point = self.__point()
-        if image and image.id() == imgId and point:
+        if image and point:
             image.setVisible(show)
             point.setVisible(not show)
             focusItem = image if show else point
@@ -215,7 +227,7 @@ class AerialObject(QObject):
 
 class AerialPoint(QGraphicsEllipseItem):
 
-    def __init__(self, radius: float = 7):
+    def __init__(self, radius: float = _pointRadius):
         super().__init__(-radius, -radius, radius * 2, radius * 2)
         self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
         self.setFlag(QGraphicsItem.ItemIsFocusable)
@@ -223,14 +235,13 @@ class AerialPoint(QGraphicsEllipseItem):
         self.setCursor(Qt.PointingHandCursor)
         self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
         self.__transformState = TransformState.original
-        self.__cross: Final = _makeOverlay('cross', self)
-        self.__tick: Final = _makeOverlay('tick', self)
+        self.__usage = Usage.unset
         self.__image: weakref.ref | None = None
 
     def itemChange(self, change: QGraphicsItem.GraphicsItemChange, v):
         if change == QGraphicsItem.ItemVisibleHasChanged:
-            if scene := cast(map_scene.MapScene, self.scene()):
-                scene.addAerialsVisible.emit(1 if v else -1)
+            if self.scene() and (image := self.image()):
+                image.object.storeVisibility(self, bool(v))
         return super().itemChange(change, v)
 
     def mouseDoubleClickEvent(self, event: QGraphicsSceneMouseEvent) -> None:
@@ -249,6 +260,16 @@ class AerialPoint(QGraphicsEllipseItem):
         QWhatsThis.showText(cast(QHelpEvent, event).globalPos(), whatsThis)
         return True
 
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget) -> None:
+        super().paint(painter, option, widget)
+        if glyph := _usageGlyphs.get(self.__usage):
+            painter.save()
+            painter.setClipPath(self.shape(), Qt.IntersectClip)
+            _drawGlyph(painter, glyph)
+            painter.restore()
+        if _isBlinkedOn(self.image()):
+            _invert(painter, self.shape())
+
     def focusInEvent(self, event: QFocusEvent) -> None:
         self.__setPen()
         updateZValue(self)
@@ -276,22 +297,220 @@ class AerialPoint(QGraphicsEllipseItem):
         self.setBrush(QBrush(availability.color))
 
     def setUsage(self, usage: Usage) -> None:
-        self.__cross.setVisible(usage == Usage.discarded)
-        self.__tick.setVisible(usage == Usage.selected)
+        if self.__usage != usage:
+            self.__usage = usage
+            self.update()
 
     def setTransformState(self, transformState: TransformState) -> None:
         self.__transformState = transformState
         self.__setPen()
 
     def __setPen(self) -> None:
-        self.setPen(QPen(QColor(162, 17, 17) if self.__transformState == TransformState.locked else Qt.black,
-                         3 if self.hasFocus() else 2,
-                         self.__transformState.penStyle))
+        self.setPen(_pointPen(self.__transformState, self.hasFocus()))
+
+
+class PointLayer(QGraphicsItem):
+    """Draw the points of all aerials that have no items, at once.
+
+    With thousands of aerials shown as points, items for each of them make scene indexing, hit-testing, and painting slow.
+    This draws them from the table, and lets the scene create the items of the point under the mouse,
+    which handle clicks, double-clicks, tool tips, and focus then.
+    Points closer to each other than a few pixels on screen get drawn as clusters, so zoomed out, painting is bounded by the view size.
+    """
+
+    # Pre-rendered points by availability, transform state, and usage.
+    __sprites: dict[tuple[Availability, TransformState, Usage], QPixmap] = {}
+
+    # Minimum cell size of clusters on screen [px].
+    __clusterSize: Final = 4 * _pointRadius
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setAcceptHoverEvents(True)
+        # Like AerialPoints without focus.
+        self.setZValue(2)
+        self.__table: AerialTable | None = None
+        self.__clusters: PointClusters | None = None
+        # Painting is needed only in view.
+        self.__rect = QRectF()
+
+    def boundingRect(self) -> QRectF:
+        return self.__rect
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget) -> None:
+        table = self.__table
+        if table is None:
+            return
+        transform = painter.worldTransform()
+        clusters = self.__clustersNear(option.exposedRect, transform)
+        if clusters is None:
+            return
+        single = clusters.counts == 1
+        # Like AerialPoints, larger ones below.
+        rows = clusters.rows[single]
+        rows = rows[np.argsort(-table.radiusBild[rows], kind='stable')]
+        painter.save()
+        painter.setWorldTransform(QTransform())
+        for (x, y), availability, transformState, usage in zip(
+                __class__.__map(transform, table.pos[rows]).tolist(), table.availability[rows].tolist(),
+                self.__transformStates(rows).tolist(), table.usage[rows].tolist()):
+            sprite = __class__.__sprite(Availability(availability), TransformState(transformState), Usage(usage))
+            painter.drawPixmap(QPointF(x - sprite.width() / 2, y - sprite.height() / 2), sprite)
+        painter.setRenderHint(QPainter.Antialiasing)
+        for (x, y), count, availabilityCounts in zip(
+                __class__.__map(transform, clusters.centers[~single]).tolist(), clusters.counts[~single].tolist(),
+                clusters.availabilityCounts[~single].tolist()):
+            __class__.__drawCluster(painter, QPointF(x, y), count, availabilityCounts)
+        painter.restore()
+
+    def hoverMoveEvent(self, event: QGraphicsSceneHoverEvent) -> None:
+        self.scene().promotePoint(self.__rowAt(event.scenePos()))
+
+    def hoverLeaveEvent(self, event: QGraphicsSceneHoverEvent) -> None:
+        self.scene().promotePoint(None)
+
+    def scene(self) -> map_scene.MapScene:
+        return cast(map_scene.MapScene, super().scene())
+
+    # end of overrides
+
+    def setTable(self, table: AerialTable | None) -> None:
+        self.__table = table
+        self.__clusters = None if table is None else PointClusters(table)
+        self.update()
+
+    def setViewedRect(self, sceneRect: QRectF) -> None:
+        self.prepareGeometryChange()
+        self.__rect = QRectF(sceneRect)
+
+    def clusterToolTip(self, scenePos: QPointF) -> str:
+        """The counts of aerials in the cluster at scenePos, if any."""
+        if self.__table is None:
+            return ''
+        transform = self.deviceTransform(self.scene().views()[0].viewportTransform())
+        clusters = self.__clustersNear(QRectF(scenePos, scenePos), transform)
+        if clusters is None:
+            return ''
+        distances = ((__class__.__map(transform, clusters.centers) -
+                      __class__.__map(transform, np.array([[scenePos.x(), scenePos.y()]]))) ** 2).sum(axis=1) ** .5
+        hit = np.flatnonzero((clusters.counts > 1) & (distances <= __class__.__clusterRadii(clusters.counts)))
+        if not len(hit):
+            return ''
+        cluster = hit[np.argmin(distances[hit])]
+        toolTip = [f'<tr><td>{el.name}</td><td>{count}</td></tr>'
+                   for names, counts in ((Availability, clusters.availabilityCounts), (Usage, clusters.usageCounts))
+                   for el, count in zip(names, counts[cluster].tolist()) if count]
+        return ''.join([f'<b>{clusters.counts[cluster]} aerials</b><table>'] + toolTip + ['</table>'])
+
+    def __clustersNear(self, sceneRect: QRectF, transform: QTransform) -> Clusters | None:
+        """The clusters whose glyphs may intersect sceneRect, for the zoom level of transform."""
+        assert self.__clusters is not None
+        level = PointClusters.level(__class__.__clusterSize / transform.determinant() ** .5)
+        cellSize = 2. ** level
+        # Whole cells only, so partial repaints aggregate the same. Glyphs extend to neighbouring cells at most.
+        left, top = (math.floor(el / cellSize - 1) * cellSize for el in (sceneRect.left(), sceneRect.top()))
+        right, bottom = (math.ceil(el / cellSize + 1) * cellSize for el in (sceneRect.right(), sceneRect.bottom()))
+        rows = self.__pointRows(QRectF(QPointF(left, top), QPointF(right, bottom)))
+        if not len(rows):
+            return None
+        return self.__clusters.aggregate(level, rows, len(Availability))
+
+    def __pointRows(self, sceneRect: QRectF) -> np.ndarray:
+        # Aerials with items are drawn by their AerialPoints.
+        table = self.__table
+        assert table is not None
+        x, y = table.pos.T
+        return np.flatnonzero(table.pointVisible & ~table.materialized &
+                              (x >= sceneRect.left()) & (x <= sceneRect.right()) & (y >= sceneRect.top()) & (y <= sceneRect.bottom()))
+
+    def __rowAt(self, scenePos: QPointF) -> int | None:
+        """The row of the topmost point at scenePos, including those with items."""
+        table = self.__table
+        if table is None:
+            return None
+        rows = np.flatnonzero(table.pointVisible)
+        if not len(rows):
+            return None
+        transform = self.deviceTransform(self.scene().views()[0].viewportTransform())
+        offsets = __class__.__map(transform, table.pos[rows]) - __class__.__map(transform, np.array([[scenePos.x(), scenePos.y()]]))
+        rows = rows[(offsets ** 2).sum(axis=1) <= _pointRadius ** 2]
+        if not len(rows):
+            return None
+        # Points in clusters are not drawn.
+        assert self.__clusters is not None
+        keys = self.__clusters.cellKeys(PointClusters.level(__class__.__clusterSize / transform.determinant() ** .5))
+        drawn = table.pointVisible & ~table.materialized
+        for row in rows[np.argsort(table.radiusBild[rows], kind='stable')].tolist():
+            if np.count_nonzero(drawn & (keys == keys[row])) - drawn[row] == 0:
+                return row
+        return None
+
+    def __transformStates(self, rows: np.ndarray) -> np.ndarray:
+        # Like AerialImage does for itself.
+        table = self.__table
+        assert table is not None
+        scale = table.radiusBild[rows] * AerialImage.scaleCartesian2map / (project_db.pixMapWidth / 2)
+        originalTrafo = np.zeros((len(rows), 6))
+        originalTrafo[:, 0] = originalTrafo[:, 3] = scale
+        isOriginal = np.isclose(table.trafo[rows], originalTrafo).all(axis=1) & np.isclose(table.pos[rows], table.origPos[rows]).all(axis=1)
+        states = np.where(isOriginal, TransformState.original, TransformState.changed)
+        states[table.locked[rows]] = TransformState.locked
+        return states
+
+    @staticmethod
+    def __clusterRadii(counts: np.ndarray) -> np.ndarray:
+        return np.minimum(_pointRadius + 2 * np.log2(counts), 3 * _pointRadius)
+
+    @staticmethod
+    def __drawCluster(painter: QPainter, center: QPointF, count: int, availabilityCounts: list[int]) -> None:
+        # A pie chart of availabilities, with the number of aerials.
+        radius = float(__class__.__clusterRadii(np.array([count]))[0])
+        rect = QRectF(center.x() - radius, center.y() - radius, 2 * radius, 2 * radius)
+        painter.setPen(Qt.NoPen)
+        startAngle = 90 * 16
+        for availability, availabilityCount in zip(Availability, availabilityCounts):
+            if availabilityCount:
+                spanAngle = round(availabilityCount / count * 360 * 16)
+                painter.setBrush(QBrush(availability.color))
+                painter.drawPie(rect, startAngle, spanAngle)
+                startAngle += spanAngle
+        painter.setPen(QPen(Qt.black, 2))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawEllipse(rect)
+        painter.drawText(rect, Qt.AlignCenter, str(count))
+
+    @staticmethod
+    def __map(transform: QTransform, points: np.ndarray) -> np.ndarray:
+        # Like QTransform.map, for affine transforms.
+        return points @ np.array([[transform.m11(), transform.m12()], [transform.m21(), transform.m22()]]) + (transform.dx(), transform.dy())
+
+    @staticmethod
+    def __sprite(availability: Availability, transformState: TransformState, usage: Usage) -> QPixmap:
+        key = availability, transformState, usage
+        if (sprite := __class__.__sprites.get(key)) is None:
+            size = 2 * (_pointRadius + 2)
+            sprite = __class__.__sprites[key] = QPixmap(size, size)
+            sprite.fill(Qt.transparent)
+            painter = QPainter(sprite)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.translate(size / 2, size / 2)
+            painter.setPen(_pointPen(transformState, False))
+            painter.setBrush(QBrush(availability.color))
+            path = QPainterPath()
+            path.addEllipse(QPointF(), _pointRadius, _pointRadius)
+            painter.drawPath(path)
+            if glyph := _usageGlyphs.get(usage):
+                painter.setClipPath(path)
+                _drawGlyph(painter, glyph)
+            painter.end()
+        return sprite
 
 
 class AerialImage(QGraphicsPixmapItem):
 
-    __pixMapWidth: Final = 3000  # Approx. width of a microfilm scan, it seems.
+    __pixMapWidth: Final = project_db.pixMapWidth
 
     __rotateCursor: Final = QCursor(QPixmap(':/plugins/selorecon/rotate'))
 
@@ -299,121 +518,98 @@ class AerialImage(QGraphicsPixmapItem):
 
     __threadPool: futures.ThreadPoolExecutor | None = None
 
+    # Where opaque images above cover this one, in item coordinates. None if uncovered, empty if completely covered.
+    __occlusionClip: QPainterPath | None = None
+
+    # Changes that affect which parts of images are covered by others.
+    __occlusionChanges: Final = frozenset({
+        QGraphicsItem.ItemVisibleHasChanged, QGraphicsItem.ItemPositionHasChanged, QGraphicsItem.ItemTransformHasChanged,
+        QGraphicsItem.ItemZValueHasChanged, QGraphicsItem.ItemOpacityHasChanged, QGraphicsItem.ItemSceneChange,
+        QGraphicsItem.ItemSceneHasChanged})
+
+    # Until image content has been read, show a flat rectangle of this logical size, without allocating a pixmap for it.
+    __placeholderSize: QSizeF | None = None
+
     # To be set beforehand by the scene:
 
     imageRootDir: Path
 
     previewRootDir: Path
 
-    scaleCartesian2map: float
+    imageIndex: FileIndex
 
-    @staticmethod
-    def createTables(db: sqlite3.Connection) -> None:
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS usages
-            (
-                id INTEGER PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL
-            ) ''')
-        db.executemany(
-            'INSERT OR IGNORE INTO usages(id, name) VALUES( ?, ? )',
-            ((el, el.name) for el in Usage))
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS aerials
-            (
-                id TEXT PRIMARY KEY NOT NULL,  -- <sortie>/<bildnr>.ecw
-                usage INT NOT NULL REFERENCES usages(id),
-                scenePos TEXT NOT NULL,
-                trafo TEXT NOT NULL,
-                trafoLocked INT NOT NULL DEFAULT 0,
-                path TEXT,                     -- Relative to imageRootDir if previewRect is NULL else to previewRootDir.
-                previewRect TEXT CHECK(previewRect ISNULL OR path NOTNULL),
-                meta TEXT NOT NULL
-            ) ''')
+    previewIndex: FileIndex
+
+    scaleCartesian2map: float
 
     @staticmethod
     def unload():
         if __class__.__threadPool is not None:
             __class__.__threadPool.shutdown(wait=False, cancel_futures=True)
+        _previewStrips.clear()
+        datasetPool.clear()
 
-    def __init__(self, imgId: str, pos: QPointF, meta, point: AerialPoint, db: sqlite3.Connection, obj: AerialObject):
+    def __init__(self, table: AerialTable, row: int, point: AerialPoint, obj: AerialObject, contrast: ContrastEnhancement):
         super().__init__()
         self.setFlag(QGraphicsItem.ItemIsMovable)
         self.setFlag(QGraphicsItem.ItemIsFocusable)
-        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
         self.setShapeMode(QGraphicsPixmapItem.BoundingRectShape)
         self.setTransformationMode(Qt.SmoothTransformation)
-        self.__origPos: Final = pos
-        self.__radiusBild: Final[float] = meta.Radius_Bild
+        self.__table: Final = table
+        self.__row: Final = row
+        imgId = table.ids[row]
+        self.__origPos: Final = QPointF(*table.origPos[row])
+        self.__radiusBild: Final = float(table.radiusBild[row])
         self.__point: Final = point
         self.__opacity: float = 1.
         self.__requestedPixMapParams: tuple[str, QRect, int, ContrastEnhancement] | None  = None
-        self.__currentContrast: ContrastEnhancement = ContrastEnhancement.clahe if claheAvailable else ContrastEnhancement.histogram
+        self.__currentContrast: ContrastEnhancement = contrast
         self.__futurePixmap: futures.Future | None = None
         self.__futurePixmapLock: Final = threading.Lock()
         self.__lastRequestedFuture: futures.Future | None = None
         self.__lastRequestedFutureLock: Final = threading.Lock()
-        self.__db: Final = db
         self.object: Final = obj
         self.__id: Final = imgId
+        self.__rasterMeta: Final = table.rasterMetas[row]
         self.__availability: Availability | None = None
         self.__transformState: TransformState = TransformState.original
-        self.__lock: Final = _makeOverlay('lock', self, QGraphicsItem.ItemIgnoresTransformations)
-        self.__cross: Final = _makeOverlay('cross', self, QGraphicsItem.ItemIgnoresTransformations)
-        self.__tick: Final = _makeOverlay('tick', self, QGraphicsItem.ItemIgnoresTransformations)
-
-        if row := db.execute('SELECT usage, scenePos, trafo, trafoLocked FROM aerials WHERE id == ?', [imgId]).fetchone():
-            usage = Usage(row[0])
-            self.setPos(QPointF(*json.loads(row[1])))
-            self.setTransform(QTransform(*json.loads(row[2])))
-            if row[3]:
-                trafoState = TransformState.locked
-            elif self.transform() == self.__originalTransform() and self.pos() == self.__origPos:
-                trafoState = TransformState.original
-            else:
-                trafoState = TransformState.changed
-            self.__setTransformState(trafoState)
+
+        # Take the state from the table, which has been filled from the DB while loading.
+        # Set the geometry before geometry changes get sent, as there is nothing to store yet.
+        m11, m12, m21, m22, dx, dy = table.trafo[row].tolist()
+        self.setPos(QPointF(*table.pos[row].tolist()))
+        self.setTransform(QTransform(m11, m12, m21, m22, dx, dy))
+        point.setPos(self.pos())
+        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
+        if table.locked[row]:
+            trafoState = TransformState.locked
+        elif self.transform() == self.__originalTransform() and self.pos() == self.__origPos:
+            trafoState = TransformState.original
         else:
-            def toJson(value):
-                if isinstance(value, datetime.date):
-                    return str(value)
-                raise TypeError(f'Unable to encode type {value.__class__}')
-
-            db.execute(
-                'INSERT INTO aerials (id, usage, scenePos, trafo, path, meta) VALUES(?, ?, ?, ?, ?, ?)',
-                [imgId,
-                 Usage.unset,
-                 json.dumps([pos.x(), pos.y()]),
-                 json.dumps(np.eye(3).ravel().tolist()),
-                 imgId if (__class__.imageRootDir / imgId).exists() else None,
-                 json.dumps(meta._asdict(), default=toJson)])
-            usage = Usage.unset
-            self.__resetTransform()
+            trafoState = TransformState.changed
+        self.__setTransformState(trafoState, store=False)
         self.__deriveAvailability()
-        self.__setUsage(usage)
-        self.__setPixMap()
+        self.__setUsage(Usage(table.usage[row]), store=False)
+        self.__setPixMap(store=False)
 
     def itemChange(self, change: QGraphicsItem.GraphicsItemChange, v):
+        if change in __class__.__occlusionChanges:
+            # Before being removed from the scene, or after having been added to one.
+            if scene := v if change == QGraphicsItem.ItemSceneHasChanged else self.scene():
+                scene.invalidateOcclusion()
         if change == QGraphicsItem.ItemVisibleHasChanged:
             if v:
                 self.__requestPixMap()
-            if scene := self.scene():
-                scene.addAerialsVisible.emit(1 if v else -1)
+            if self.scene():
+                self.object.storeVisibility(self, bool(v))
         elif change == QGraphicsItem.ItemPositionHasChanged:
             self.__point.setPos(v)
-            self.__db.execute(
-                'UPDATE aerials SET scenePos = ? WHERE id == ?',
-                [json.dumps([v.x(), v.y()]), self.__id])
+            self.__storeGeometry()
             if scene := self.scene():
                 scene.aerialFootPrintChanged.emit(self.__id, self.footprint())
             self.__setTransformState(TransformState.changed)
         elif change == QGraphicsItem.ItemTransformHasChanged:
-            self.__db.execute(
-                'UPDATE aerials SET trafo = ? WHERE id == ?',
-                [json.dumps([
-                    v.m11(), v.m12(), v.m13(),
-                    v.m21(), v.m22(), v.m23(),
-                    v.m31(), v.m32(), v.m33()]), self.__id])
+            self.__storeGeometry()
             if scene := self.scene():
                 scene.aerialFootPrintChanged.emit(self.__id, self.footprint())
             self.__setTransformState(TransformState.changed)
@@ -533,6 +729,8 @@ Double-click to close.<br/>
 
     def focusOutEvent(self, event: QFocusEvent) -> None:
         updateZValue(self)
+        # The user has probably finished transforming this aerial.
+        self.__table.flush()
         super().focusOutEvent(event)
 
     def contextMenuEvent(self, event: QGraphicsSceneContextMenuEvent) -> None:
@@ -571,7 +769,18 @@ Double-click to close.<br/>
                 self.__futurePixmap = None
         if pm is not None:
             self.__setPixMap(pm)
-        super().paint(painter, option, widget)
+        occlusionClip = self.__occlusionClip
+        if occlusionClip is not None:
+            if occlusionClip.isEmpty():
+                # Completely covered by opaque images above.
+                return
+            painter.save()
+            painter.setClipPath(occlusionClip, Qt.IntersectClip)
+        if self.__placeholderSize is None:
+            super().paint(painter, option, widget)
+        else:
+            # As a QBitmap filled with color1 would be drawn with the default pen.
+            painter.fillRect(self.boundingRect(), Qt.black)
         painter.save()
         # Qt 5.15 docs for QGraphicsItem::paint say:
         #   "QGraphicsItem does not support use of cosmetic pens with a non-zero width."
@@ -582,45 +791,76 @@ Double-click to close.<br/>
         pen.setCosmetic(True)
         painter.setPen(pen)
         painter.drawRect(self.boundingRect())
+        # Glyphs of constant size on screen, centered on the image. Within it, as QGraphicsView repaints only the bounding rect.
+        glyphs = [_usageGlyphs.get(self.usage())]
+        if self.__transformState == TransformState.locked:
+            glyphs.insert(0, 'lock')
+        if glyphs := [glyph for glyph in glyphs if glyph]:
+            painter.setClipRect(self.boundingRect(), Qt.IntersectClip)
+            for glyph in glyphs:
+                _drawGlyph(painter, glyph)
         painter.restore()
+        if _isBlinkedOn(self):
+            _invert(painter, self.shape())
+        if occlusionClip is not None:
+            painter.restore()
 
     def scene(self) -> map_scene.MapScene:
         return cast(map_scene.MapScene, super().scene())
 
+    def boundingRect(self) -> QRectF:
+        if self.__placeholderSize is None:
+            return super().boundingRect()
+        return QRectF(self.offset(), self.__placeholderSize)
+
+    def shape(self) -> QPainterPath:
+        if self.__placeholderSize is None:
+            return super().shape()
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
+
     # end of overrides
 
-    def __setPixMap(self, pm: QPixmap | None = None):
+    def __setPixMap(self, pm: QPixmap | None = None, store: bool = True):
         if pm is None:
-            pixMapWidth = __class__.__pixMapWidth
-            path, previewRect = self.__db.execute('SELECT path, previewRect FROM aerials WHERE id == ?',
-                                                  [self.__id]).fetchone()
-            if previewRect:
-                width, height, rotation = json.loads(previewRect)[2:]
-                if rotation % 2:
-                    width, height = height, width
-            elif path:
-                with GdalPushLogHandler():
-                    ds = gdal.Open(str(__class__.imageRootDir / path))
-                    width, height = ds.RasterXSize, ds.RasterYSize
-            else:
-                width, height = [pixMapWidth] * 2
-            pm = QBitmap(pixMapWidth, _pixMapHeightFor(pixMapWidth, QSize(width, height)))
-            pm.fill(Qt.color1)
-        origPm = self.pixmap()
-        self.setPixmap(pm)
-        self.setOffset(-pm.width() / 2, -pm.height() / 2)
-        if origPm.size() != pm.size():
+            path, previewRect = self.__table.paths[self.__row], self.__table.previewRects[self.__row]
+            rasterSize = None
+            if previewRect is None and path:
+                if self.__rasterMeta is not None:
+                    rasterSize = self.__rasterMeta.width, self.__rasterMeta.height
+                else:
+                    with datasetPool.open(__class__.imageRootDir / path) as ds:
+                        rasterSize = ds.RasterXSize, ds.RasterYSize
+            placeholderSize = QSizeF(*project_db.itemSize(previewRect, rasterSize))
+        else:
+            placeholderSize = None
+        origSize = self.boundingRect().size()
+        # boundingRect depends on __placeholderSize, so tell Qt before changing it.
+        self.prepareGeometryChange()
+        self.__placeholderSize = placeholderSize
+        self.setPixmap(QPixmap() if pm is None else pm)
+        if scene := self.scene():
+            # Placeholders are opaque, and the pixmap may have another size.
+            scene.invalidateOcclusion()
+        size = QSizeF(pm.size()) if placeholderSize is None else placeholderSize
+        self.setOffset(-size.width() / 2, -size.height() / 2)
+        if origSize != size:
+            if not store:
+                # The item starts out empty, but with its size as stored. Do not write that back unchanged.
+                self.__table.setGeometry(self.__row, *self.__geometry())
+                return
+            self.__storeGeometry()
             if scene := self.scene():
                 scene.aerialFootPrintChanged.emit(self.__id, self.footprint())
 
     def __requestPixMap(self):
-        path, previewRect = self.__db.execute('SELECT path, previewRect FROM aerials WHERE id == ?',
-                                              [self.__id]).fetchone()
-        if previewRect is None:
+        path, storedRect = self.__table.paths[self.__row], self.__table.previewRects[self.__row]
+        if storedRect is None:
             rotationCcw = 0
             previewRect = QRect()
         else:
-            *rect, rotationCcw = json.loads(previewRect)
+            *rect, rotationCcw = storedRect
             previewRect = QRect(*rect)
         if self.__availability in (Availability.preview, Availability.image):
             if not self.__requestedPixMapParams or self.__requestedPixMapParams != (path, previewRect, rotationCcw, self.__currentContrast):
@@ -659,12 +899,8 @@ Double-click to close.<br/>
         return self.__availability
 
     def __deriveAvailability(self) -> None:
-        path, rect = self.__db.execute('SELECT path, previewRect FROM aerials WHERE id == ?', [self.__id]).fetchone()
-        if path is None:
-            filmDir = self.previewRootDir / Path(self.__id).parent
-            availability = Availability.findPreview if filmDir.exists() else Availability.missing
-        else:
-            availability = Availability.image if rect is None else Availability.preview
+        path, rect = self.__table.paths[self.__row], self.__table.previewRects[self.__row]
+        availability = deriveAvailability(self.__id, path, rect, __class__.previewIndex)
         if self.__availability != availability:
             if scene := self.scene():
                 absPath = ''
@@ -672,6 +908,7 @@ Double-click to close.<br/>
                     absPath = str(__class__.previewRootDir / path if rect else __class__.imageRootDir / path)
                 scene.aerialAvailabilityChanged.emit(self.__id, int(availability), absPath)
         self.__availability = availability
+        self.__table.availability[self.__row] = availability
         self.__point.setAvailability(availability)
         self.__setMovability()
 
@@ -681,39 +918,32 @@ Double-click to close.<br/>
         self.setFlag(QGraphicsItem.ItemIsMovable, availability >= Availability.preview and self.__transformState != TransformState.locked)
 
     def usage(self) -> Usage:
-        value, = self.__db.execute(
-            'SELECT usage FROM aerials WHERE id == ?',
-            [self.__id]).fetchone()
-        return Usage(value)
-
-    def __setUsage(self, usage: Usage) -> None:
-        self.__cross.setVisible(usage == Usage.discarded)
-        self.__tick.setVisible(usage == Usage.selected)
+        return Usage(self.__table.usage[self.__row])
+
+    def __setUsage(self, usage: Usage, store: bool = True) -> None:
+        # Unless the usage has just been read from the table.
+        if store:
+            self.__table.storeUsage(self.__row, usage)
+        self.update()
         self.__point.setUsage(usage)
         if scene := self.scene():
             scene.aerialUsageChanged.emit(self.__id, int(usage))
-        self.__db.execute(
-            'UPDATE aerials SET usage = ? WHERE id == ?',
-            [usage, self.__id])
 
     def transformState(self) -> TransformState:
         return self.__transformState
 
-    def __setTransformState(self, transformState: TransformState) -> None:
+    def __setTransformState(self, transformState: TransformState, store: bool = True) -> None:
         self.__transformState = transformState
         isLocked = transformState == TransformState.locked
-        self.__db.execute(
-            'UPDATE aerials SET trafoLocked = ? WHERE id == ?',
-            [isLocked, self.__id])
-        self.__lock.setVisible(isLocked)
+        if store:
+            self.__table.storeLocked(self.__row, isLocked)
+        self.update()
         self.__setMovability()
         updateZValue(self)
         self.__point.setTransformState(transformState)
 
     def __originalTransform(self) -> QTransform:
-        scale = self.__radiusBild * __class__.scaleCartesian2map / (__class__.__pixMapWidth / 2)
-        # Actually, 2 times this scale seems a bit closer to the true scale.
-        return QTransform.fromScale(scale, scale)
+        return QTransform(*project_db.originalTrafo(self.__radiusBild, __class__.scaleCartesian2map))
 
     def __resetTransform(self):
         self.setTransform(self.__originalTransform())
@@ -733,11 +963,9 @@ Double-click to close.<br/>
         dialog = PreviewWindow(filmDir, Path(self.__id).stem)
         if dialog.exec() == QDialog.Accepted:
             path, rect, viewRotationCcw = dialog.selection()
-            self.__db.execute(
-                'UPDATE aerials SET path = ?, previewRect = ? WHERE id == ?',
-                [str(path.relative_to(__class__.previewRootDir)),
-                 json.dumps([rect.left(), rect.top(), rect.width(), rect.height(), viewRotationCcw]),
-                 self.__id])
+            path = str(path.relative_to(__class__.previewRootDir))
+            previewRect = PreviewRect(rect.left(), rect.top(), rect.width(), rect.height(), viewRotationCcw)
+            self.__table.storePreview(self.__row, path, previewRect)
             self.__deriveAvailability()
             self.__requestPixMap()
 
@@ -756,18 +984,16 @@ Double-click to close.<br/>
         gdalTrafo = np.zeros((2, 3))
         gdalTrafo[:, 0] = topLeft.x(), topLeft.y()
         gdalTrafo[:, 1:] = transform[:2, :2].T  # Qt actually uses the transpose.
-        path, previewRect = self.__db.execute('SELECT path, previewRect FROM aerials WHERE id == ?',
-                                              [self.__id]).fetchone()
-        assert previewRect is None
-        with GdalPushLogHandler():
-            ds = gdal.Open(str(__class__.imageRootDir / path))
+        path = self.__table.paths[self.__row]
+        assert self.__table.previewRects[self.__row] is None
+        with GdalPushLogHandler(), datasetPool.open(__class__.imageRootDir / path) as ds:
             gdalTrafo[:, 1:] *= __class__.__pixMapWidth / ds.RasterXSize  # display -> native resolution.
             gdalTrafo[1, :] *= -1.  # Scene -> WCS
             try:
                 gdalTrafo, aerialPts, orthoPts = georef(ds, gdalTrafo)
             except:
                 return logger.exception('Automatic georeferencing failed.')
-        scaleNative2display = __class__.__pixMapWidth / ds.RasterXSize
+            scaleNative2display = __class__.__pixMapWidth / ds.RasterXSize
         aerialPts *= scaleNative2display
         orthoPts *= scaleNative2display
         off = np.array([self.offset().x(), self.offset().y()])
@@ -814,34 +1040,67 @@ Double-click to close.<br/>
     def id(self):
         return self.__id
 
-    def footprint(self):
-        # CS QGraphicsScene -> WCS: invert y-coordinate
-        return [{'x': pt.x(), 'y': -pt.y()} for pt in self.mapToScene(self.boundingRect())[:-1]]
+    def release(self) -> None:
+        # About to be removed from the scene. Do not let a pending pixmap reach a deleted item.
+        with self.__lastRequestedFutureLock:
+            if self.__lastRequestedFuture:
+                self.__lastRequestedFuture.cancel()
+            self.__lastRequestedFuture = None
+
+    def isOpaque(self) -> bool:
+        # Pixmaps are read into opaque images, and placeholders are painted opaque, too.
+        return self.effectiveOpacity() >= 1.
+
+    def setOcclusionClip(self, clip: QPainterPath | None) -> None:
+        self.__occlusionClip = clip
+
+    def footprint(self) -> list[dict[str, float]]:
+        # As stored by __storeGeometry.
+        return self.__table.footprint(self.__row)
 
     def radiusBild(self) -> float:
         return self.__radiusBild
 
+    def __geometry(self) -> tuple[tuple[float, float], tuple[float, ...], tuple[float, float]]:
+        pos, tr, size = self.pos(), self.transform(), self.boundingRect().size()
+        return (pos.x(), pos.y()), (tr.m11(), tr.m12(), tr.m21(), tr.m22(), tr.dx(), tr.dy()), (size.width(), size.height())
+
+    def __storeGeometry(self) -> None:
+        self.__table.storeGeometry(self.__row, *self.__geometry())
+
+
+def deriveAvailability(imgId: str, path: str | None, previewRect: PreviewRect | None, previewIndex: FileIndex) -> Availability:
+    # path and previewRect as stored in the DB.
+    if path is None:
+        return Availability.findPreview if previewIndex.isDir(Path(imgId).parent) else Availability.missing
+    return Availability.image if previewRect is None else Availability.preview
+
 
 def _pixMapHeightFor(width: int, size: QSize) -> int:
     return round(size.height() / size.width() * width)
 
 def _getPixMap(path: Path, width: int, rect: QRect, rotationCcw: int, contrast: ContrastEnhancement):
-    with GdalPushLogHandler():
-        ds = gdal.Open(str(path))
-        if rect.isNull():
+    if rect.isNull():
+        with GdalPushLogHandler(), datasetPool.open(path) as ds:
             rect = QRect(0, 0, ds.RasterXSize, ds.RasterYSize)
+            img = _readRaster(ds, rect, width, _pixMapHeightFor(width, rect.size()), gdal.GRIORA_Gauss)
+    else:
         height = _pixMapHeightFor(width, rect.size())
-        img = QImage(width, height, QImage.Format_RGBA8888)
-        img.fill(Qt.white)
-        ptr = img.bits()
-        ptr.setsize(img.sizeInBytes())
-        assert ds.RasterCount in (1, 3)
-        iBands = [1] * 3 if ds.RasterCount == 1 else [1, 2, 3]
-        ds.ReadRaster1(rect.left(), rect.top(), rect.width(), rect.height(),
-                       width, height, gdal.GDT_Byte, iBands,
-                       buf_pixel_space=4, buf_line_space=width * 4, buf_band_space=1,
-                       resample_alg=gdal.GRIORA_Gauss,
-                       inputOutputBuf=ptr)
+        # The overview level with at least the resolution needed.
+        level = max(math.floor(math.log2(rect.width() / width)), 0)
+        strip = _previewStrips.get(path, level)
+        if strip is None:
+            # Too large to be cached at that level. Read only the window needed, as for images.
+            with GdalPushLogHandler(), datasetPool.open(path) as ds:
+                img = _readRaster(ds, rect, width, height, gdal.GRIORA_Gauss)
+        else:
+            # Crop the preview from its decoded strip, which is shared by all aerials of the strip.
+            # At that level, it gets scaled down by less than half, so smooth scaling does not alias.
+            scale = 2. ** -level
+            stripRect = QRectF(rect.left() * scale, rect.top() * scale, rect.width() * scale, rect.height() * scale).toAlignedRect()
+            img = strip.copy(stripRect & strip.rect()).scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            # enhanceContrast expects this format, but scaled may have returned another one.
+            img = img.convertToFormat(QImage.Format_RGBA8888)
     if rotationCcw != 0:
         #arr = np.ndarray(shape=(img.height(), img.width(), 4), dtype=np.uint8, buffer=ptr)
         #rotated = np.rot90(arr, k=rotationCcw)
@@ -854,14 +1113,132 @@ def _getPixMap(path: Path, width: int, rect: QRect, rotationCcw: int, contrast:
     enhanceContrast(img, contrast)
     return QPixmap.fromImage(img)
 
-def _makeOverlay(name: str, parent: QGraphicsItem, flag: QGraphicsItem.GraphicsItemFlag | None = None):
-    pm = QPixmap(':/plugins/selorecon/' + name)
-    item = QGraphicsPixmapItem(pm, parent)
-    item.setOffset(-pm.width() / 2, -pm.height() / 2)
-    item.setTransformationMode(Qt.SmoothTransformation)
-    if flag is not None:
-        item.setFlag(flag)
-    return item
+def _readRaster(ds: gdal.Dataset, rect: QRect, width: int, height: int, resampleAlg: int) -> QImage:
+    img = QImage(width, height, QImage.Format_RGBA8888)
+    img.fill(Qt.white)
+    ptr = img.bits()
+    ptr.setsize(img.sizeInBytes())
+    assert ds.RasterCount in (1, 3)
+    iBands = [1] * 3 if ds.RasterCount == 1 else [1, 2, 3]
+    ds.ReadRaster1(rect.left(), rect.top(), rect.width(), rect.height(),
+                   width, height, gdal.GDT_Byte, iBands,
+                   buf_pixel_space=4, buf_line_space=width * 4, buf_band_space=1,
+                   resample_alg=resampleAlg,
+                   inputOutputBuf=ptr)
+    return img
+
+
+class _PreviewStrips:
+    """Preview strips decoded at overview levels, least recently used first."""
+
+    # Do not cache strips larger than this at the level asked for, so the budget holds a useful number of them.
+    __maxStripPixels: Final = 16_000_000
+
+    def __init__(self, maxBytes: int) -> None:
+        self.__maxBytes: Final = maxBytes
+        self.__lock: Final = threading.Lock()
+        # (path, level) -> strip
+        self.__strips: Final[collections.OrderedDict[tuple[str, int], QImage]] = collections.OrderedDict()
+        # (path, level) -> set when a thread has finished decoding it.
+        self.__decoding: Final[dict[tuple[str, int], threading.Event]] = {}
+
+    def get(self, path: Path, level: int) -> QImage | None:
+        """The strip at path, at 1 / 2**level of its resolution. None if that is too large to be cached."""
+        key = str(path), level
+        while True:
+            with self.__lock:
+                if (strip := self.__strips.get(key)) is not None:
+                    self.__strips.move_to_end(key)
+                    return strip
+                decoded = self.__decoding.get(key)
+                if decoded is None:
+                    decoded = self.__decoding[key] = threading.Event()
+                    break
+            # Another aerial of the same strip is being read in another thread. Wait for it instead of decoding it twice.
+            decoded.wait()
+        try:
+            with GdalPushLogHandler(), datasetPool.open(path) as ds:
+                width, height = (max(round(size / 2 ** level), 1) for size in (ds.RasterXSize, ds.RasterYSize))
+                if width * height > __class__.__maxStripPixels:
+                    return None
+                # Gauss, as for images. GDAL reads from the overview of that level, if present.
+                strip = _readRaster(ds, QRect(0, 0, ds.RasterXSize, ds.RasterYSize), width, height,
+                                    gdal.GRIORA_NearestNeighbour if level == 0 else gdal.GRIORA_Gauss)
+            with self.__lock:
+                self.__strips[key] = strip
+                nBytes = sum(el.sizeInBytes() for el in self.__strips.values())
+                while nBytes > self.__maxBytes and len(self.__strips) > 1:
+                    _, oldest = self.__strips.popitem(last=False)
+                    nBytes -= oldest.sizeInBytes()
+            return strip
+        finally:
+            with self.__lock:
+                del self.__decoding[key]
+            decoded.set()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__strips.clear()
+
+
+_previewStrips: Final = _PreviewStrips(512 * 2 ** 20)
+
+_usageGlyphs: Final = {Usage.discarded: 'cross', Usage.selected: 'tick'}
+
+# Shared by all items. Filled on first use, as QPixmaps need a QApplication.
+_glyphPixmaps: Final[dict[str, QPixmap]] = {}
+
+
+def _pointPen(transformState: TransformState, hasFocus: bool) -> QPen:
+    return QPen(QColor(162, 17, 17) if transformState == TransformState.locked else Qt.black, 3 if hasFocus else 2, transformState.penStyle)
+
+
+def _isBlinkedOn(image: AerialImage | None) -> bool:
+    return image is not None and image.object.isAnimated() and (scene := image.scene()) is not None and scene.isBlinkedOn()
+
+
+def _invert(painter: QPainter, path: QPainterPath) -> None:
+    """Invert what has been painted within path. Much cheaper than rendering offscreen through a QGraphicsEffect."""
+    painter.save()
+    painter.setCompositionMode(QPainter.CompositionMode_Difference)
+    painter.fillPath(path, Qt.white)
+    painter.restore()
+
+
+def _drawGlyph(painter: QPainter, name: str) -> None:
+    """Draw the glyph centered on the item origin, ignoring the item's transformations."""
+    if (pm := _glyphPixmaps.get(name)) is None:
+        pm = _glyphPixmaps[name] = QPixmap(':/plugins/selorecon/' + name)
+    center = painter.worldTransform().map(QPointF())
+    painter.save()
+    painter.setWorldTransform(QTransform())
+    painter.setRenderHint(QPainter.SmoothPixmapTransform)
+    painter.drawPixmap(QPointF(center.x() - pm.width() / 2, center.y() - pm.height() / 2), pm)
+    painter.restore()
+
+
+def cullOccludedImages(images: list[AerialImage], exposedSceneRect: QRectF) -> None:
+    """Let images skip painting wherever opaque images above cover them. images must be sorted from top to bottom."""
+    exposed = QPainterPath()
+    exposed.addRect(exposedSceneRect)
+    covered = QPainterPath()
+    exposedIsCovered = False
+    for image in images:
+        if exposedIsCovered:
+            # Avoid any further path operations.
+            image.setOcclusionClip(QPainterPath())
+            continue
+        footprint = image.mapToScene(image.shape()).intersected(exposed)
+        if covered.isEmpty() or not covered.intersects(footprint):
+            image.setOcclusionClip(None)
+        else:
+            uncovered = footprint.subtracted(covered)
+            image.setOcclusionClip(uncovered if uncovered.isEmpty() else image.mapFromScene(uncovered))
+        if image.isOpaque():
+            covered = covered.united(footprint)
+            if covered.elementCount() > 1000:
+                covered = covered.simplified()
+            exposedIsCovered = covered.contains(exposedSceneRect)
 
 
 """
@@ -0,0 +1,252 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Compact state of all aerials of a project, one row per aerial.
+
+Graphics items exist only for aerials in or near the viewport.
+All other aerials are represented here only, so the scene can tell where they are and whether they are shown,
+and materialize their items when the view gets close to them.
+Items read their state from here, and store their changes here, which writes them through to the project DB.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from collections.abc import Sequence
+import logging
+import math
+from typing import Final, NamedTuple
+
+from .dataset_pool import RasterMeta
+from .project_db import itemSize, PreviewRect, StoredAerial, Usage, WriteBehind
+
+logger: Final = logging.getLogger(__name__)
+
+
+class AerialTable:
+
+    # Per-row arrays, to be concatenated when extending.
+    __columns: Final = 'origPos', 'radiusBild', 'pos', 'trafo', 'size', 'footprints', 'bounds', 'usage', 'availability', 'locked', 'filtered', 'pointVisible', 'imageVisible', 'materialized'
+
+    def __init__(self, ids: Sequence[str], metas: Sequence, origPos: np.ndarray, rasterMetas: Sequence[RasterMeta | None]) -> None:
+        nRows = len(ids)
+        self.ids: Final = list(ids)
+        self.__rows: Final = {imgId: row for row, imgId in enumerate(self.ids)}
+        # Rows of the spreadsheet.
+        self.metas: Final = list(metas)
+        self.rasterMetas: Final = list(rasterMetas)
+        # path and previewRect as stored in the DB.
+        self.paths: Final[list[str | None]] = [None] * nRows
+        self.previewRects: Final[list[PreviewRect | None]] = [None] * nRows
+        # Scene coordinates. The rest is kept up to date by the items while they exist.
+        self.origPos = np.asarray(origPos, dtype=float).reshape(nRows, 2)
+        self.radiusBild = np.array([meta.Radius_Bild for meta in self.metas], dtype=float)
+        self.pos = self.origPos.copy()
+        # m11, m12, m21, m22, dx, dy, as in QTransform.
+        self.trafo = np.zeros((nRows, 6))
+        self.trafo[:, [0, 3]] = 1.
+        # Logical size of the image item [px].
+        self.size = np.zeros((nRows, 2))
+        # Corners of the images in WCS, as sent to the web view.
+        self.footprints = np.zeros((nRows, 4, 2))
+        # Scene bounding rectangles of the images: left, top, right, bottom.
+        self.bounds = np.zeros((nRows, 4))
+        self.__updateFootprints(slice(None))
+        self.usage = np.zeros(nRows, dtype=np.int8)
+        self.availability = np.zeros(nRows, dtype=np.int8)
+        self.locked = np.zeros(nRows, dtype=bool)
+        # Whether the aerial passes the filter of the web view.
+        self.filtered = np.ones(nRows, dtype=bool)
+        self.pointVisible = np.zeros(nRows, dtype=bool)
+        self.imageVisible = np.zeros(nRows, dtype=bool)
+        # Whether the aerial has graphics items.
+        self.materialized = np.zeros(nRows, dtype=bool)
+        # Persists the changes stored below. Set by the scene for the table it shows. Batches being loaded have none.
+        self.writer: WriteBehind | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def extend(self, other: AerialTable) -> None:
+        """Append the rows of other, e.g. of the next batch being loaded."""
+        nRows = len(self)
+        self.ids.extend(other.ids)
+        self.__rows.update((imgId, nRows + row) for row, imgId in enumerate(other.ids))
+        self.metas.extend(other.metas)
+        self.rasterMetas.extend(other.rasterMetas)
+        self.paths.extend(other.paths)
+        self.previewRects.extend(other.previewRects)
+        for name in __class__.__columns:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+
+    def row(self, imgId: str) -> int | None:
+        return self.__rows.get(imgId)
+
+    def setStored(self, row: int, aerial: StoredAerial) -> None:
+        """Set the state of row as stored in the DB."""
+        self.usage[row] = aerial.usage
+        self.locked[row] = aerial.trafoLocked
+        self.paths[row] = aerial.path
+        self.previewRects[row] = aerial.previewRect
+        rasterMeta = self.rasterMetas[row]
+        rasterSize = None if aerial.previewRect is not None or not aerial.path or rasterMeta is None else (rasterMeta.width, rasterMeta.height)
+        self.setGeometry(row, aerial.scenePos, aerial.trafo, itemSize(aerial.previewRect, rasterSize))
+
+    def isStored(self, row: int, aerial: StoredAerial) -> bool:
+        """Whether row is in the state stored in the DB."""
+        return (self.usage[row] == aerial.usage and self.locked[row] == aerial.trafoLocked and self.paths[row] == aerial.path and
+                self.previewRects[row] == aerial.previewRect and tuple(self.pos[row].tolist()) == aerial.scenePos and
+                tuple(self.trafo[row].tolist()) == aerial.trafo)
+
+    def isPending(self, row: int) -> bool:
+        """Whether changes of row have not been written yet."""
+        return self.writer is not None and self.writer.isPending(self.ids[row])
+
+    def setGeometry(self, row: int, pos: tuple[float, float], trafo: tuple[float, ...], size: tuple[float, float]) -> None:
+        self.pos[row] = pos
+        self.trafo[row] = trafo
+        self.size[row] = size
+        self.__updateFootprints(slice(row, row + 1))
+
+    def storeUsage(self, row: int, usage: Usage) -> None:
+        self.usage[row] = usage
+        # Store explicit decisions at once.
+        self.__write(row, usage=int(usage))
+
+    def storeLocked(self, row: int, locked: bool) -> None:
+        self.locked[row] = locked
+        self.__update(row, trafoLocked=locked)
+
+    def storePreview(self, row: int, path: str, previewRect: PreviewRect) -> None:
+        self.paths[row] = path
+        self.previewRects[row] = previewRect
+        self.__write(row, path=path, previewLeft=previewRect.left, previewTop=previewRect.top, previewWidth=previewRect.width,
+                     previewHeight=previewRect.height, previewRotationCcw=previewRect.rotationCcw)
+
+    def storeGeometry(self, row: int, pos: tuple[float, float], trafo: tuple[float, ...], size: tuple[float, float]) -> None:
+        self.setGeometry(row, pos, trafo, size)
+        # Frequent while an aerial is being dragged or zoomed.
+        self.__update(row, posX=pos[0], posY=pos[1], **dict(zip(('m11', 'm12', 'm21', 'm22', 'dx', 'dy'), trafo)))
+        if self.writer is not None:
+            self.writer.updateBounds(self.ids[row], tuple(self.bounds[row].tolist()))
+
+    def flush(self) -> None:
+        if self.writer is not None:
+            self.writer.flush()
+
+    def footprint(self, row: int) -> list[dict[str, float]]:
+        return [{'x': x, 'y': y} for x, y in self.footprints[row].tolist()]
+
+    def intersecting(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """Boolean mask of the rows whose image bounds intersect the given scene rectangle."""
+        bounds = self.bounds
+        return (bounds[:, 0] <= right) & (bounds[:, 2] >= left) & (bounds[:, 1] <= bottom) & (bounds[:, 3] >= top)
+
+    def visibleBounds(self) -> tuple[float, float, float, float] | None:
+        # Points are drawn with a constant size on screen, so only their positions matter.
+        rects = np.concatenate([self.bounds[self.imageVisible], np.tile(self.pos[self.pointVisible], 2)])
+        return __class__.__union(rects)
+
+    def allBounds(self) -> tuple[float, float, float, float] | None:
+        return __class__.__union(self.bounds)
+
+    def nVisible(self) -> int:
+        return int(np.count_nonzero(self.pointVisible) + np.count_nonzero(self.imageVisible))
+
+    def __write(self, row: int, **columns) -> None:
+        if self.writer is not None:
+            self.writer.write(self.ids[row], **columns)
+
+    def __update(self, row: int, **columns) -> None:
+        if self.writer is not None:
+            self.writer.update(self.ids[row], **columns)
+
+    def __updateFootprints(self, rows: slice) -> None:
+        # Like QGraphicsItem.mapToScene(boundingRect()), with the image centered on the item origin.
+        local = self.size[rows, np.newaxis, :] / 2 * [[-1, -1], [1, -1], [1, 1], [-1, 1]]
+        trafo = self.trafo[rows]
+        corners = np.einsum('nij,njk->nik', local, trafo[:, :4].reshape(-1, 2, 2)) + (trafo[:, 4:] + self.pos[rows])[:, np.newaxis, :]
+        self.bounds[rows, :2] = corners.min(axis=1)
+        self.bounds[rows, 2:] = corners.max(axis=1)
+        # CS QGraphicsScene -> WCS: invert y-coordinate
+        corners[:, :, 1] *= -1
+        self.footprints[rows] = corners
+
+    @staticmethod
+    def __union(rects: np.ndarray) -> tuple[float, float, float, float] | None:
+        if not len(rects):
+            return None
+        return (*rects[:, :2].min(axis=0).tolist(), *rects[:, 2:].max(axis=0).tolist())
+
+
+class Clusters(NamedTuple):
+    # Per cell of a grid, with at least one of the given rows.
+    rows: np.ndarray  # first row in the cell
+    counts: np.ndarray
+    centers: np.ndarray  # mean positions
+    availabilityCounts: np.ndarray  # nCells x nAvailabilities
+    usageCounts: np.ndarray  # nCells x len(Usage)
+
+
+class PointClusters:
+    """Aggregate the positions of aerials on hierarchical grids, so zoomed out, one glyph per cell can be drawn instead of each point.
+
+    The cells of level k are squares of 2**k scene units.
+    The cells of all rows get computed once per level used, and then updated only for the rows that have moved, or that have been added.
+    """
+
+    def __init__(self, table: AerialTable) -> None:
+        self.__table: Final = table
+        # level -> positions as of the computation of cells, and cell keys.
+        self.__levels: Final[dict[int, tuple[np.ndarray, np.ndarray]]] = {}
+
+    @staticmethod
+    def level(cellSize: float) -> int:
+        """The level with cells at least as large as cellSize [scene units]."""
+        return math.ceil(math.log2(cellSize))
+
+    def cellKeys(self, level: int) -> np.ndarray:
+        table = self.__table
+        pos, keys = self.__levels.get(level, (np.empty((0, 2)), np.empty(0, dtype=np.int64)))
+        nCached = len(pos)
+        rows = np.flatnonzero((pos != table.pos[:nCached]).any(axis=1))
+        if len(rows) or nCached < len(table):
+            rows = np.concatenate([rows, np.arange(nCached, len(table))])
+            pos = np.concatenate([pos, table.pos[nCached:]])
+            keys = np.concatenate([keys, np.empty(len(table) - nCached, dtype=np.int64)])
+            pos[rows] = table.pos[rows]
+            # Column and row indices, packed into one integer.
+            indices = np.floor(pos[rows] / 2. ** level).astype(np.int64)
+            keys[rows] = (indices[:, 0] << 32) | (indices[:, 1] & 0xFFFFFFFF)
+            self.__levels[level] = pos, keys
+        return keys
+
+    def aggregate(self, level: int, rows: np.ndarray, nAvailabilities: int) -> Clusters:
+        """Aggregate the given rows by the cells of level."""
+        table = self.__table
+        _, first, inverse, counts = np.unique(self.cellKeys(level)[rows], return_index=True, return_inverse=True, return_counts=True)
+        nCells = len(counts)
+        pos = table.pos[rows]
+        centers = np.column_stack([np.bincount(inverse, weights=pos[:, 0], minlength=nCells),
+                                   np.bincount(inverse, weights=pos[:, 1], minlength=nCells)]) / counts[:, np.newaxis]
+
+        def countsBy(codes: np.ndarray, nCodes: int) -> np.ndarray:
+            return np.bincount(inverse * nCodes + codes, minlength=nCells * nCodes).reshape(nCells, nCodes)
+
+        return Clusters(rows[first], counts, centers, countsBy(table.availability[rows], nAvailabilities), countsBy(table.usage[rows], len(Usage)))
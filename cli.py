@@ -0,0 +1,177 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Prepare and maintain projects without QGIS or a display, e.g. on a server overnight.
+
+Uses the same stages as loading a spreadsheet in the PlugIn, so the resulting data bases and caches are the same.
+Projects are processed in parallel, each one in its own process.
+"""
+from __future__ import annotations
+
+from osgeo import gdal, osr
+
+import argparse
+from concurrent import futures
+import configparser
+import logging
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Final
+
+from . import ingest
+from . import project_db
+
+# As done by MainWindow for the PlugIn. Otherwise, gdal.Open returns None for files it fails to open.
+gdal.UseExceptions()
+
+logger: Final = logging.getLogger(__name__)
+
+# As used by MainWindow for its map.
+_epsg: Final = 3857
+
+_batchSize: Final = 2000
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog=f'python -m {__package__}',
+                                     description='Prepare and maintain SelORecon projects without QGIS.')
+    parser.add_argument('--config', type=Path, default=Path(__file__).parent / 'selorecon.cfg',
+                        help='Configuration file with the image and preview root directories. Default: %(default)s')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of projects to process in parallel. Default: %(default)s')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log debug messages.')
+    subParsers = parser.add_subparsers(dest='subcommand', required=True)
+    subParser = subParsers.add_parser('ingest', help='Create or update the data bases of spreadsheets of aerial meta data.')
+    subParser.add_argument('--overwrite', action='store_true', help='Discard existing data bases, including selections and orientations.')
+    subParser.set_defaults(process=_ingest)
+    subParser = subParsers.add_parser('rescan', help='Update the data bases to the image files present now.')
+    subParser.set_defaults(process=_rescan, overwrite=False)
+    subParser = subParsers.add_parser('cache', help='Pre-build the caches of spreadsheets and file indices.')
+    subParser.set_defaults(process=_cache, overwrite=False)
+    subParser = subParsers.add_parser('compact', help='Defragment the data bases and update their statistics.')
+    subParser.set_defaults(process=_compact, overwrite=False)
+    for subParser in subParsers.choices.values():
+        subParser.add_argument('spreadsheets', type=Path, nargs='+', metavar='spreadsheet',
+                               help='Spreadsheet of aerial meta data. Its data base and caches are next to it.')
+    args = parser.parse_args(argv)
+
+    logLevel = logging.DEBUG if args.verbose else logging.INFO
+    _setupLogging(logLevel)
+    config = configparser.ConfigParser()
+    with open(args.config) as fin:
+        config.read_file(fin)
+
+    nFailed = 0
+    with futures.ProcessPoolExecutor(max_workers=max(min(args.jobs, len(args.spreadsheets)), 1),
+                                     initializer=_setupLogging, initargs=(logLevel,)) as processPool:
+        futs = {processPool.submit(args.process, fileName.resolve(), config, args.overwrite): fileName
+                for fileName in args.spreadsheets}
+        for future in futures.as_completed(futs):
+            fileName = futs[future]
+            try:
+                print(f'{fileName}: {future.result()}')
+            except ingest.IngestError as ex:
+                nFailed += 1
+                print(f'{fileName}: {ex.title}: {ex}', file=sys.stderr)
+            except Exception as ex:
+                nFailed += 1
+                logger.exception(f'{fileName} failed.')
+                print(f'{fileName}: {ex}', file=sys.stderr)
+    return 1 if nFailed else 0
+
+
+def _setupLogging(level: int) -> None:
+    logging.basicConfig(level=level, format='{asctime} {processName} {levelname}: {name} - {message}', style='{')
+
+
+def _ingest(fileName: Path, config: configparser.ConfigParser, overwrite: bool) -> str:
+    start = time.monotonic()
+    df, sheetName, projectName = ingest.readAerialsFile(fileName)
+    imageRootDir, previewRootDir = ingest.rootDirs(config, fileName)
+    imageIndex, _ = ingest.buildFileIndices(imageRootDir, previewRootDir, fileName)
+    wcs = osr.SpatialReference()
+    wcs.ImportFromEPSG(_epsg)
+    scaleCartesian2map = 1.
+    if len(df):
+        scaleCartesian2map = ingest.scaleCartesian2map(wcs, ingest.transformToWcs(df.iloc[:1], wcs)[0])
+    dbPath = ingest.dbPathFor(fileName)
+    if overwrite:
+        dbPath.unlink(missing_ok=True)
+    db = project_db.connect(dbPath, config.get('DATABASE', 'journalMode', fallback='DELETE'))
+    try:
+        project_db.createTables(db)
+        stored = project_db.fetchAerials(db)
+        nStored = len(stored)
+        shouldBeMissing, shouldBeThere = [], []
+        for begin in range(0, len(df), _batchSize):
+            _, resolved = ingest.storeBatch(db, df.iloc[begin:begin + _batchSize], wcs, imageIndex, scaleCartesian2map, stored)
+            shouldBeMissing.extend(resolved.shouldBeMissing)
+            shouldBeThere.extend(resolved.shouldBeThere)
+    finally:
+        db.close()
+    msgs = [f'project {projectName}', f'{len(df)} aerials of sheet {sheetName}', f'{len(stored) - nStored} new']
+    if shouldBeMissing:
+        msgs.append(f'{len(shouldBeMissing)} image files present although LBDB says they should be missing')
+    if shouldBeThere:
+        msgs.append(f'{len(shouldBeThere)} image files missing although LBDB says they should be present')
+    msgs.append(f'{time.monotonic() - start:.1f}s')
+    return '; '.join(msgs)
+
+
+def _rescan(fileName: Path, config: configparser.ConfigParser, overwrite: bool) -> str:
+    dbPath = _existingDbPath(fileName)
+    imageRootDir, previewRootDir = ingest.rootDirs(config, fileName)
+    imageIndex, _ = ingest.buildFileIndices(imageRootDir, previewRootDir, fileName)
+    db = project_db.connect(dbPath)
+    try:
+        # Migrate DBs stored by an older version.
+        project_db.createTables(db)
+        nFound, nLost = ingest.rescanImages(db, imageIndex)
+    finally:
+        db.close()
+    return f'{nFound} image files found, {nLost} lost'
+
+
+def _cache(fileName: Path, config: configparser.ConfigParser, overwrite: bool) -> str:
+    df, _, _ = ingest.readAerialsFile(fileName)
+    imageRootDir, previewRootDir = ingest.rootDirs(config, fileName)
+    ingest.buildFileIndices(imageRootDir, previewRootDir, fileName)
+    return f'caches of {len(df)} aerials up to date'
+
+
+def _compact(fileName: Path, config: configparser.ConfigParser, overwrite: bool) -> str:
+    dbPath = _existingDbPath(fileName)
+    size = dbPath.stat().st_size
+    db = project_db.connect(dbPath)
+    try:
+        # Migrate DBs stored by an older version.
+        project_db.createTables(db)
+        db.execute('VACUUM')
+        db.execute('PRAGMA optimize')
+    finally:
+        db.close()
+    return f'{size / 2**20:.1f}MB -> {dbPath.stat().st_size / 2**20:.1f}MB'
+
+
+def _existingDbPath(fileName: Path) -> Path:
+    dbPath = ingest.dbPathFor(fileName)
+    if not dbPath.exists():
+        raise ingest.IngestError('No data base', f'{dbPath} does not exist. Ingest {fileName} first.')
+    return dbPath
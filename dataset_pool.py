@@ -0,0 +1,110 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Keep GDAL datasets of aerials and previews open across reads.
+
+Opening an ECW means parsing its header, which is expensive on network shares.
+Also, GDAL drops the cached blocks of a dataset when closing it.
+Hence, keep recently used datasets open, keyed by path.
+GDAL datasets must not be used by multiple threads at the same time.
+Hence, each thread gets its own handle, and handles in use are never closed.
+"""
+from __future__ import annotations
+
+from osgeo import gdal
+
+import collections
+from collections.abc import Iterator
+import contextlib
+import logging
+from pathlib import Path
+import threading
+from typing import Final, NamedTuple
+
+from . import Config, GdalPushLogHandler
+
+logger: Final = logging.getLogger(__name__)
+
+
+class DatasetPool:
+
+    def __init__(self, maxOpen: int) -> None:
+        self.__maxOpen: Final = maxOpen
+        self.__lock: Final = threading.Lock()
+        # (path, thread identifier) -> [dataset, number of current users]. Least recently used first.
+        self.__entries: Final[collections.OrderedDict[tuple[str, int], list]] = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def open(self, path: Path | str) -> Iterator[gdal.Dataset]:
+        key = str(path), threading.get_ident()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                entry[1] += 1
+        if entry is None:
+            # Do not hold the lock while opening, which may take long.
+            # No other thread uses this key, so nobody else can insert it meanwhile.
+            with GdalPushLogHandler():
+                ds = gdal.Open(key[0])
+            if ds is None:
+                # Unless gdal.UseExceptions() has been called. Do not cache the failure.
+                raise RuntimeError(f'Failed to open {key[0]}')
+            logger.debug(f'Opened {key[0]}')
+            entry = [ds, 1]
+            with self.__lock:
+                self.__entries[key] = entry
+                self.__evict()
+        try:
+            yield entry[0]
+        finally:
+            with self.__lock:
+                entry[1] -= 1
+                self.__evict()
+
+    def clear(self) -> None:
+        with self.__lock:
+            for key in [key for key, (_, nUsers) in self.__entries.items() if not nUsers]:
+                del self.__entries[key]
+
+    def __evict(self) -> None:
+        # Closes the least recently used datasets that are not in use, beyond the limit of open files.
+        nExcess = len(self.__entries) - self.__maxOpen
+        if nExcess <= 0:
+            return
+        for key in [key for key, (_, nUsers) in self.__entries.items() if not nUsers][:nExcess]:
+            # Dropping the last reference closes the dataset.
+            del self.__entries[key]
+
+
+datasetPool: Final = DatasetPool(Config.maxOpenDatasets.value)
+
+
+class RasterMeta(NamedTuple):
+    width: int
+    height: int
+    bandCount: int
+    overviewCount: int
+    fileSize: int  # [bytes]
+
+
+def readRasterMeta(path: Path) -> RasterMeta:
+    with datasetPool.open(path) as ds:
+        overviewCount = ds.GetRasterBand(1).GetOverviewCount() if ds.RasterCount else 0
+        return RasterMeta(ds.RasterXSize, ds.RasterYSize, ds.RasterCount, overviewCount, path.stat().st_size)
@@ -0,0 +1,134 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Index the files and directories below the image and preview root directories.
+
+These typically reside on network shares, where each call of Path.exists is a round trip.
+Hence, list each directory once, in parallel for the top-level directories,
+and answer all existence queries from memory.
+Optionally, store the listings together with the modification times of their directories.
+Next time, directories with unchanged modification times need not be listed again.
+"""
+from __future__ import annotations
+
+from concurrent import futures
+import json
+import logging
+import os
+from pathlib import Path, PurePath
+import time
+from typing import Final
+
+logger: Final = logging.getLogger(__name__)
+
+# Directory path relative to the root, in POSIX notation -> [modification time [ns], file names, sub-directory names]
+_Listings = dict[str, list]
+
+
+class FileIndex:
+
+    __cacheVersion: Final = 1
+
+    def __init__(self, rootDir: Path, listings: _Listings) -> None:
+        self.rootDir: Final = rootDir
+        self.__dirs: Final = {_normalize(relDir) for relDir in listings}
+        self.__paths: Final = self.__dirs | {_normalize(_join(relDir, name))
+                                             for relDir, (_, fileNames, _) in listings.items() for name in fileNames}
+
+    @staticmethod
+    def build(rootDir: Path, cachePath: Path | None = None) -> FileIndex:
+        cached = __class__.__loadCache(rootDir, cachePath) if cachePath is not None else {}
+        listings: _Listings = {}
+        if rootDir.is_dir():
+            start = time.monotonic()
+            listings[''] = rootListing = _list(rootDir, cached.get(''))
+            with futures.ThreadPoolExecutor(thread_name_prefix='FileIndex') as threadPool:
+                for subListings in threadPool.map(lambda name: _listTree(rootDir, name, cached), rootListing[2]):
+                    listings.update(subListings)
+            logger.info(f'{rootDir} indexed in {time.monotonic() - start:.1f}s: {len(listings)} directories.')
+            if cachePath is not None:
+                __class__.__storeCache(rootDir, cachePath, listings)
+        else:
+            logger.warning(f'{rootDir} does not exist.')
+        return FileIndex(rootDir, listings)
+
+    def exists(self, relPath: str | PurePath) -> bool:
+        return _normalize(relPath) in self.__paths
+
+    def isDir(self, relPath: str | PurePath) -> bool:
+        return _normalize(relPath) in self.__dirs
+
+    @staticmethod
+    def __loadCache(rootDir: Path, cachePath: Path) -> _Listings:
+        try:
+            with cachePath.open(encoding='utf-8') as fin:
+                cache = json.load(fin)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            logger.warning(f'Ignoring the file index {cachePath}: {ex}')
+            return {}
+        if cache.get('version') != __class__.__cacheVersion or cache.get('rootDir') != str(rootDir):
+            return {}
+        return cache['listings']
+
+    @staticmethod
+    def __storeCache(rootDir: Path, cachePath: Path, listings: _Listings) -> None:
+        tmpPath = cachePath.with_name(cachePath.name + '.tmp')
+        try:
+            with tmpPath.open('w', encoding='utf-8') as fout:
+                json.dump({'version': __class__.__cacheVersion, 'rootDir': str(rootDir), 'listings': listings}, fout)
+            tmpPath.replace(cachePath)
+        except OSError as ex:
+            logger.warning(f'Failed to store the file index {cachePath}: {ex}')
+
+
+def _normalize(relPath: str | PurePath) -> str:
+    # Like the file systems on Windows, be case-insensitive there.
+    return os.path.normcase(os.path.normpath(relPath))
+
+
+def _join(relDir: str, name: str) -> str:
+    return f'{relDir}/{name}' if relDir else name
+
+
+def _list(absDir: Path, cached: list | None) -> list:
+    mtime = absDir.stat().st_mtime_ns
+    if cached is not None and cached[0] == mtime:
+        return cached
+    fileNames, subDirNames = [], []
+    with os.scandir(absDir) as entries:
+        for entry in entries:
+            # On Windows, is_dir needs no system call, as this has been returned by scandir already.
+            (subDirNames if entry.is_dir() else fileNames).append(entry.name)
+    return [mtime, fileNames, subDirNames]
+
+
+def _listTree(rootDir: Path, relDir: str, cached: _Listings) -> _Listings:
+    listings: _Listings = {}
+    relDirs = [relDir]
+    while relDirs:
+        relDir = relDirs.pop()
+        try:
+            listings[relDir] = listing = _list(rootDir / relDir, cached.get(relDir))
+        except OSError as ex:
+            logger.warning(f'Failed to list {rootDir / relDir}: {ex}')
+            continue
+        relDirs.extend(_join(relDir, name) for name in listing[2])
+    return listings
@@ -0,0 +1,290 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Stages of loading a spreadsheet of aerial meta data that do not need Qt:
+parse and clean the spreadsheet, resolve the image ids, transform the coordinates, and check the file system.
+Hence, they may run in worker threads.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from osgeo import osr
+
+import configparser
+from concurrent import futures
+import logging
+from pathlib import Path
+import sqlite3
+import time
+from typing import Final, NamedTuple
+
+from .aerial_table import AerialTable
+from .dataset_pool import RasterMeta, readRasterMeta
+from .fs_index import FileIndex
+from . import project_db
+from .project_db import StoredAerial, Usage
+from .spreadsheet_cache import CachedSpreadsheet, SpreadsheetCache
+
+logger: Final = logging.getLogger(__name__)
+
+
+class IngestError(Exception):
+    def __init__(self, title: str, msg: str) -> None:
+        super().__init__(msg)
+        self.title: Final = title
+
+    def __reduce__(self):
+        # Be re-raised in the parent process when ingesting in a process pool.
+        return __class__, (self.title, str(self))
+
+
+class ResolvedIds(NamedTuple):
+    imgIds: list[str]
+    presentImgIds: list[str]
+    # File names that contradict column LBDB.
+    shouldBeMissing: list[str]
+    shouldBeThere: list[str]
+
+
+def dbPathFor(fileName: Path) -> Path:
+    """The project data base of a spreadsheet. Caches are stored next to it."""
+    return fileName.with_suffix('.sqlite')
+
+
+def readAerialsFile(fileName: Path) -> CachedSpreadsheet:
+    dbPath = dbPathFor(fileName)
+    cache = SpreadsheetCache(fileName, dbPath.with_name(dbPath.stem + '.spreadsheet'))
+    cached = cache.load()
+    if cached is None:
+        cached = parseAerialsFile(fileName)
+        cache.store(cached)
+    return cached
+
+
+def parseAerialsFile(fileName: Path) -> CachedSpreadsheet:
+    # Parse only the sheets needed, not the whole workbook.
+    with pd.ExcelFile(str(fileName)) as excel:
+        sheet_names = 'Geo_Abfrage_SQL', 'Geo_Abfrage'
+        for sheet_name in sheet_names:
+            if sheet_name in excel.sheet_names:
+                break
+        else:
+            raise IngestError('Load aerial image meta data', f"{fileName} contains no sheet named {', '.join(sheet_names)}")
+        df = excel.parse(sheet_name, true_values=['Ja', 'ja'], false_values=['Nein', 'nein'])
+        cleanAerialData(df, sheet_name)
+        try:
+            zusammenfassung = excel.parse('Zusammenfassung', nrows=2)
+            projectName = str(zusammenfassung.columns[0])
+        except:
+            projectName = fileName.stem
+    return CachedSpreadsheet(df, sheet_name, projectName)
+
+
+def cleanAerialData(df: pd.DataFrame, sheet_name: str) -> None:
+    def error(msg):
+        raise IngestError("Erroneous Coordinate Reference System", msg)
+    fulls = 'Sortie Spot Bildnr Datum MASSTAB QU Acc BLänder Abd LBDB Quelle x y xWGS84 yWGS84'.split()
+    fulls = {elem.lower() : elem for elem in fulls}
+    # Projekte LBDB\Meeting_2021-06-10_Testprojekte\Testprojekt1 and Testprojekt2 contain a column with EPSG-Code, either named 'EPSG-Code', or 'EPSGCode'.
+    # More fuzz: Graz contains columns RechtsGK3, HochGK3, RechtsGK4, HochGK4. Both GK4 columns are empty. GK3 columns are filled, but correspond to EPSG:31468 i.e. zone 4, not 3!
+    abbrs = ('epsg', 'EPSG_Code'), ('radius', 'Radius_Bild'), ('rechtsgk3', 'RechtsGK'), ('hochgk3', 'HochGK')
+    rename = {}
+    empty = []
+    for pres in df.columns:
+        if not df[pres].count():
+            empty.append(pres)
+        elif pres.lower() in fulls:
+            rename[pres] = fulls[pres.lower()]
+        else:
+            for abbr, full in abbrs:
+                if pres.lower() == abbr.lower():
+                    rename[pres] = full
+                    break
+    df.drop(columns=empty, inplace=True)
+    df.rename(columns={old: new for old, new in rename.items() if old != new}, inplace=True)
+    df['Datum'] = df['Datum'].dt.date  # strip time of day
+    if {'xWGS84', 'yWGS84'}.issubset(df.columns):
+        df['EPSG_Code'] = [4326] * len(df)
+        df.rename(columns={'xWGS84': 'x', 'yWGS84': 'y'}, inplace=True)
+    elif 'EPSG_Code' in df.columns:
+        assert {'x', 'y'}.issubset(df.columns)
+    elif {'RechtsGK', 'HochGK'}.issubset(df.columns):
+        df['EPSG_Code'] = [31468] * len(df)
+        df.rename(columns={'RechtsGK': 'x', 'HochGK': 'y'}, inplace=True)
+    else:
+        error(f"{sheet_name} seems to provide no information on coordinate system. Columns are: {', '.join(df.columns)}")
+
+
+def rootDirs(config: configparser.ConfigParser, fileName: Path) -> tuple[Path, Path]:
+    """The image and preview root directories. Relative ones are relative to the spreadsheet."""
+    previewRootDir = Path(config['PREVIEWS']['rootDir'])
+    if not previewRootDir.is_absolute():
+        previewRootDir = fileName.parent / previewRootDir
+    imageRootDir = Path(config['IMAGES']['rootDir'])
+    if not imageRootDir.is_absolute():
+        imageRootDir = fileName.parent / imageRootDir
+    # Hack
+    if not imageRootDir.exists() and imageRootDir.name.lower() == 'images' and imageRootDir.with_name('Bilder').exists():
+        imageRootDir = imageRootDir.with_name('Bilder')
+    return imageRootDir, previewRootDir
+
+
+def buildFileIndices(imageRootDir: Path, previewRootDir: Path, fileName: Path) -> tuple[FileIndex, FileIndex]:
+    # Answer all existence queries from memory, instead of asking the file system per aerial.
+    dbPath = dbPathFor(fileName)
+    imageIndex = FileIndex.build(imageRootDir, dbPath.with_name(dbPath.stem + '.images.index.json'))
+    previewIndex = FileIndex.build(previewRootDir, dbPath.with_name(dbPath.stem + '.previews.index.json'))
+    return imageIndex, previewIndex
+
+
+def transformToWcs(df: pd.DataFrame, wcs: osr.SpatialReference) -> np.ndarray:
+    # Transform the coordinates of all aerials with the same CRS at once.
+    missing = df['EPSG_Code'].isna().to_numpy()
+    if missing.any():
+        # Spreadsheet rows are 1-based, below the header.
+        rows = ', '.join(str(label + 2) for label in df.index[missing])
+        raise IngestError("Erroneous Coordinate Reference System", f'Spreadsheet rows {rows} specify no EPSG code.')
+    wcsCtrs = np.full((len(df), 2), np.nan)
+    coords = df[['x', 'y']].to_numpy(dtype=float)
+    for epsg, indices in df.groupby('EPSG_Code').indices.items():
+        csDb = osr.SpatialReference()
+        csDb.ImportFromEPSG(int(epsg))
+        assert csDb.IsProjected() or csDb.IsGeographic()
+        db2wcs = osr.CoordinateTransformation(csDb, wcs)
+        pts = coords[indices]
+        if csDb.EPSGTreatsAsNorthingEasting() or csDb.EPSGTreatsAsLatLong():
+            pts = pts[:, ::-1]
+        wcsCtrs[indices] = np.array(db2wcs.TransformPoints(np.ascontiguousarray(pts)))[:, :2]
+    return wcsCtrs
+
+
+def scaleCartesian2map(wcs: osr.SpatialReference, wcsCtr: np.ndarray) -> float:
+    # Consider the scale distortion of Web Mercator.
+    csWgs84Cartesian = osr.SpatialReference()
+    csWgs84Cartesian.ImportFromEPSG(4978)
+    wcs2cartesian = osr.CoordinateTransformation(wcs, csWgs84Cartesian)
+    cartes1, cartes2 = np.array(wcs2cartesian.TransformPoints(wcsCtr + [[0., 0.], [1000., 0.]]))
+    return float(1000. / np.linalg.norm(cartes2 - cartes1))
+
+
+def resolveImageIds(df: pd.DataFrame, imageIndex: FileIndex) -> ResolvedIds:
+    resolved = ResolvedIds([], [], [], [])
+    for row in df.itertuples(index=False):
+        imgId = f'{row.Datum.year}-{row.Datum.month:02}-{row.Datum.day:02}_{row.Sortie}_{row.Bildnr}.ecw'
+        if not imageIndex.exists(imgId):
+            imgId = (Path(row.Sortie) / f'{row.Bildnr}.ecw').as_posix()
+        imgFileExists = imageIndex.exists(imgId)
+        if imgFileExists:
+            resolved.presentImgIds.append(imgId)
+        if not row.LBDB and imgFileExists:
+            resolved.shouldBeMissing.append(Path(imgId).name)
+        elif row.LBDB and not imgFileExists:
+            resolved.shouldBeThere.append(Path(imgId).name)
+        resolved.imgIds.append(str(imgId))
+    return resolved
+
+
+def prescanRasterMetas(imageRootDir: Path, imgIds: list[str]) -> dict[str, RasterMeta]:
+    # Reading the raster size of an aerial is needed to show its placeholder with the right aspect ratio.
+    # Opening ECWs one after another takes long, especially on network drives. Hence, read them in parallel.
+    scanned = {}
+    if not imgIds:
+        return scanned
+    start = time.monotonic()
+    with futures.ThreadPoolExecutor(thread_name_prefix='RasterPrescan') as threadPool:
+        futs = {threadPool.submit(readRasterMeta, imageRootDir / imgId): imgId for imgId in imgIds}
+        for future in futures.as_completed(futs):
+            try:
+                scanned[futs[future]] = future.result()
+            except Exception as ex:
+                logger.warning(f'Failed to read the raster meta data of {futs[future]}: {ex}')
+    logger.info(f'Raster meta data of {len(imgIds)} aerials pre-scanned in {time.monotonic() - start:.1f}s.')
+    return scanned
+
+
+def storeBatch(db: sqlite3.Connection, part: pd.DataFrame, wcs: osr.SpatialReference, imageIndex: FileIndex,
+               scaleCartesian2map: float, stored: dict[str, StoredAerial]) -> tuple[AerialTable, ResolvedIds]:
+    """Resolve, transform, and pre-scan a batch of aerials, insert the new ones into db and stored, and return them with their stored state."""
+    resolved = resolveImageIds(part, imageIndex)
+    wcsCtrs = transformToWcs(part, wcs)
+    # Read what has not been stored in the DB before.
+    rasterMetas = {imgId: aerial.rasterMeta for imgId in resolved.presentImgIds
+                   if (aerial := stored.get(imgId)) is not None and aerial.rasterMeta is not None}
+    scannedRasterMetas = prescanRasterMetas(imageIndex.rootDir, [imgId for imgId in resolved.presentImgIds if imgId not in rasterMetas])
+    rasterMetas |= scannedRasterMetas
+    # WCS -> CS QGraphicsScene: invert y-coordinate
+    batch = AerialTable(resolved.imgIds, list(part.itertuples(index=False)), wcsCtrs * (1., -1.),
+                        [rasterMetas.get(imgId) for imgId in resolved.imgIds])
+    new = []
+    for imgId, meta, origPos, radiusBild in zip(batch.ids, batch.metas, batch.origPos.tolist(), batch.radiusBild.tolist(), strict=True):
+        if imgId not in stored:
+            stored[imgId] = aerial = StoredAerial(
+                Usage.unset, tuple(origPos), project_db.originalTrafo(radiusBild, scaleCartesian2map), False,
+                imgId if imageIndex.exists(imgId) else None, None, rasterMetas.get(imgId))
+            new.append((imgId, aerial, meta))
+    for row, imgId in enumerate(batch.ids):
+        batch.setStored(row, stored[imgId])
+    # Speed up the creating of a new DB, especially if it is located on a network drive.
+    # Also, errors during setup will leave an existing DB in the state of the previous batch.
+    db.execute('BEGIN TRANSACTION')
+    try:
+        project_db.insertAerials(db, new)
+        # Rows stored by an older version lack their raster meta data.
+        project_db.storeRasterMetas(db, {imgId: rasterMeta for imgId, rasterMeta in scannedRasterMetas.items()
+                                         if stored[imgId].rasterMeta is None})
+        # Also index the aerials stored before the spatial index existed, or before their raster meta data was known.
+        project_db.storeBounds(db, zip(batch.ids, batch.bounds.tolist()))
+        db.execute('COMMIT TRANSACTION')
+    except:
+        db.execute('ROLLBACK TRANSACTION')
+        for imgId, *_ in new:
+            # Not stored after all.
+            del stored[imgId]
+        raise
+    return batch, resolved
+
+
+def rescanImages(db: sqlite3.Connection, imageIndex: FileIndex) -> tuple[int, int]:
+    """Update the image paths of stored aerials without preview to the files present now. Return the numbers found and lost."""
+    stored = project_db.fetchAerials(db)
+    paths = {imgId: imgId if imageIndex.exists(imgId) else None
+             for imgId, aerial in stored.items() if aerial.previewRect is None}
+    changed = {imgId: path for imgId, path in paths.items() if path != stored[imgId].path}
+    rasterMetas = prescanRasterMetas(imageIndex.rootDir, [imgId for imgId, path in paths.items()
+                                                          if path is not None and stored[imgId].rasterMeta is None])
+    # The sizes of their items depend on both, so update their spatial index, too.
+    bounds = []
+    for imgId in changed.keys() | rasterMetas.keys():
+        aerial = stored[imgId]
+        path = changed.get(imgId, aerial.path)
+        rasterMeta = rasterMetas.get(imgId, aerial.rasterMeta)
+        rasterSize = None if not path or rasterMeta is None else (rasterMeta.width, rasterMeta.height)
+        bounds.append((imgId, project_db.itemBounds(aerial.scenePos, aerial.trafo, project_db.itemSize(None, rasterSize))))
+    db.execute('BEGIN TRANSACTION')
+    try:
+        db.executemany('UPDATE aerials SET path = ? WHERE id == ?', ((path, imgId) for imgId, path in changed.items()))
+        project_db.storeRasterMetas(db, rasterMetas)
+        project_db.storeBounds(db, bounds)
+        db.execute('COMMIT TRANSACTION')
+    except:
+        db.execute('ROLLBACK TRANSACTION')
+        raise
+    nFound = sum(path is not None for path in changed.values())
+    return nFound, len(changed) - nFound
@@ -18,7 +18,7 @@
  ***************************************************************************/
 
 """
-from qgis.PyQt.QtCore import pyqtSignal, pyqtSlot, QElapsedTimer, QMargins, QRectF, Qt, QUrl
+from qgis.PyQt.QtCore import pyqtSignal, pyqtSlot, QElapsedTimer, QMargins, Qt, QUrl
 from qgis.PyQt.QtGui import QDesktopServices, QIcon, QStandardItem
 from qgis.PyQt.QtWidgets import QActionGroup, QDialog, QDialogButtonBox, QComboBox, QMenu, QMessageBox, QTableView, QTextEdit, QToolButton, QVBoxLayout, QWhatsThis
 from qgis.PyQt.uic import loadUiType
@@ -33,7 +33,7 @@ gdal.UseExceptions()
 
 from . import Config, getLoggerAndFileHandler, GdalPushLogHandler
 from .map_scene import MapScene, Availability, Usage
-from .aerial_item import Visualization
+from .aerial_item import AerialImage, AerialPoint, PointLayer, Visualization
 from .preview_window import claheAvailable, ContrastEnhancement
 
 
@@ -87,19 +87,18 @@ class MainWindow(FormBase):
 
         scene = self.ui.mapView.scene()
         webView = self.ui.webView
-        scene.aerialsLoaded.connect(webView.aerialsLoaded)
+        scene.aerialsSnapshot.connect(webView.aerialsSnapshot)
+        scene.aerialsDelta.connect(webView.aerialsDelta)
         scene.attackDataLoaded.connect(webView.attackDataLoaded)
         scene.areaOfInterestLoaded.connect(webView.areaOfInterestLoaded)
-        scene.aerialFootPrintChanged.connect(webView.aerialFootPrintChanged)
-        scene.aerialAvailabilityChanged.connect(webView.aerialAvailabilityChanged)
-        scene.aerialUsageChanged.connect(webView.aerialUsageChanged)
         self.__filteredImageIds: set[str] = set()
         webView.filterAerials.connect(self.__filterAerials)
         webView.highlightAerials.connect(scene.highlightAerials)
         webView.showAsImage.connect(scene.showAsImage)
+        webView.requestAerialsSnapshot.connect(scene.emitAerialsSnapshot)
         # Having re-loaded the web page (with possibly changed JavaScript), re-transmit to the page the data we have.
         # Otherwise, the whole PlugIn would need to be re-loaded, meaning a shut-down and re-start of the HTTP-server, which takes time.
-        webView.loadFinished.connect(lambda ok: scene.emitAerialsLoaded() if ok else None)
+        webView.loadFinished.connect(lambda ok: scene.emitAerialsSnapshot() if ok else None)
         webView.loadFinished.connect(lambda ok: scene.emitAttackDataLoaded() if ok else None)
         webView.loadFinished.connect(lambda ok: scene.emitAreaOfInterestLoaded() if ok else None)
 
@@ -173,9 +172,10 @@ class MainWindow(FormBase):
         ui.mapSelect.setCurrentIndex(defIdx)
 
         def fitVisible():
-            rect = QRectF()
+            # Computed from the table of aerials, including those without items.
+            rect = scene.visibleAerialsBoundingRect()
             for item in scene.items():
-                if item.isVisible():
+                if item.isVisible() and not isinstance(item, (AerialImage, AerialPoint, PointLayer)):
                     rect |= item.sceneBoundingRect()
             if rect:
                 rect = mapView.mapFromScene(rect).boundingRect().marginsAdded(QMargins() + 20)
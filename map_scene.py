@@ -19,14 +19,14 @@
 """
 from __future__ import annotations
 
-from qgis.PyQt.QtCore import pyqtSignal, pyqtSlot, Qt, QPointF, QSettings
+from qgis.PyQt.QtCore import pyqtSignal, pyqtSlot, Qt, QObject, QPointF, QRectF, QSettings, QTimer
 from qgis.PyQt.QtGui import QKeyEvent, QPen, QPolygonF
-from qgis.PyQt.QtWidgets import QFileDialog, QGraphicsPolygonItem, QGraphicsScene, QInputDialog, QMessageBox
+from qgis.PyQt.QtWidgets import (QFileDialog, QGraphicsPolygonItem, QGraphicsScene, QGraphicsSceneHelpEvent, QInputDialog, QMessageBox,
+                                 QProgressDialog, QToolTip)
 
 import numpy as np
 import pandas as pd
 from osgeo import ogr, osr
-import sqlite3
 
 import collections
 import configparser
@@ -35,8 +35,18 @@ import gc
 import json
 import logging
 from pathlib import Path
-
-from .aerial_item import ContrastEnhancement, AerialObject, AerialImage, Availability, Usage
+import sqlite3
+import threading
+from typing import Final, NamedTuple
+
+from .aerial_item import (ContrastEnhancement, AerialObject, AerialImage, AerialPoint, Availability, cullOccludedImages,
+                          deriveAvailability, PointLayer, Usage, Visualization)
+from .aerial_table import AerialTable
+from .fs_index import FileIndex
+from . import ingest
+from . import project_db
+from .preview_window import claheAvailable
+from .web_protocol import AerialsFeed
 
 logger = logging.getLogger(__name__)
 
@@ -47,12 +57,136 @@ def _truncateMsg(msg: str, maxLen=500):
     return msg
 
 
+def _deriveAvailabilities(table: AerialTable, previewIndex: FileIndex) -> None:
+    for row, imgId in enumerate(table.ids):
+        table.availability[row] = deriveAvailability(imgId, table.paths[row], table.previewRects[row], previewIndex)
+    # Like newly created items, before the visualization gets set.
+    table.pointVisible[:] = True
+
+
+class _LoadSummary(NamedTuple):
+    nAerials: int
+    sheetName: str
+    shouldBeMissing: list[str]
+    shouldBeThere: list[str]
+
+
+class _LoadContext(NamedTuple):
+    projectName: str
+    imageRootDir: Path
+    previewRootDir: Path
+    imageIndex: FileIndex
+    previewIndex: FileIndex
+    scaleCartesian2map: float
+
+
+class _AerialsLoader(QObject):
+    """Load a spreadsheet of aerials in a worker thread, and stream them in batches to the GUI thread."""
+
+    # Emitted from the worker thread, and hence received through queued connections.
+    progressed = pyqtSignal(str, int, int)  # label, value, maximum
+
+    prepared = pyqtSignal(object)  # _LoadContext, once the spreadsheet has been parsed. Waits for proceed() then.
+
+    batchLoaded = pyqtSignal(object)  # AerialTable
+
+    finished = pyqtSignal(object)  # _LoadSummary, also if cancelled
+
+    failed = pyqtSignal(str, str)  # title, message
+
+    __batchSize: Final = 2000
+
+    def __init__(self, fileName: Path, dbPath: Path, discardDb: bool, config: configparser.ConfigParser, wcs: osr.SpatialReference,
+                 generation: int) -> None:
+        super().__init__()
+        # A cancelled loader finishes in the background. The scene drops what it still sends by its generation.
+        self.generation: Final = generation
+        self.dbPath: Final = dbPath
+        self.discardDb: Final = discardDb
+        self.__fileName: Final = fileName
+        self.__config: Final = config
+        self.__wcs: Final = wcs.Clone()
+        self.__cancelled: Final = threading.Event()
+        self.__proceeded: Final = threading.Event()
+        self.__thread: Final = threading.Thread(target=self.__run, name='AerialsLoader', daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    @pyqtSlot()
+    def cancel(self) -> None:
+        self.__cancelled.set()
+        self.__proceeded.set()
+
+    def proceed(self) -> None:
+        # Called by the scene when it has closed the previous project, and the DB is ready.
+        self.__proceeded.set()
+
+    def wait(self) -> None:
+        self.__thread.join()
+
+    def isRunning(self) -> bool:
+        return self.__thread.is_alive()
+
+    def __run(self) -> None:
+        try:
+            self.__load()
+        except ingest.IngestError as ex:
+            logger.error(str(ex))
+            self.failed.emit(ex.title, str(ex))
+        except Exception as ex:
+            logger.exception('Loading aerials failed.')
+            self.failed.emit('Load aerial image meta data', str(ex))
+
+    def __load(self) -> None:
+        fileName, wcs = self.__fileName, self.__wcs
+        self.progressed.emit('Parsing the spreadsheet ...', 0, 0)
+        df, sheetName, projectName = ingest.readAerialsFile(fileName)
+        summary = _LoadSummary(len(df), sheetName, [], [])
+        if self.__cancelled.is_set():
+            return self.finished.emit(summary)
+        self.progressed.emit('Indexing image and preview files ...', 0, 0)
+        imageRootDir, previewRootDir = ingest.rootDirs(self.__config, fileName)
+        imageIndex, previewIndex = ingest.buildFileIndices(imageRootDir, previewRootDir, fileName)
+        scaleCartesian2map = 1.
+        if len(df):
+            scaleCartesian2map = ingest.scaleCartesian2map(wcs, ingest.transformToWcs(df.iloc[:1], wcs)[0])
+        if self.__cancelled.is_set():
+            return self.finished.emit(summary)
+        self.prepared.emit(_LoadContext(projectName, imageRootDir, previewRootDir, imageIndex, previewIndex, scaleCartesian2map))
+        self.__proceeded.wait()
+        if self.__cancelled.is_set():
+            return self.finished.emit(summary)
+        db = project_db.connect(self.dbPath)
+        try:
+            # The state of all aerials stored before, read at once instead of per aerial.
+            stored = project_db.fetchAerials(db)
+            for begin in range(0, len(df), __class__.__batchSize):
+                if self.__cancelled.is_set():
+                    logger.info(f'Loading {fileName} cancelled after {begin} of {len(df)} aerials.')
+                    break
+                self.progressed.emit('Loading aerials ...', begin, len(df))
+                batch, resolved = ingest.storeBatch(db, df.iloc[begin:begin + __class__.__batchSize], wcs, imageIndex,
+                                                    scaleCartesian2map, stored)
+                summary.shouldBeMissing.extend(resolved.shouldBeMissing)
+                summary.shouldBeThere.extend(resolved.shouldBeThere)
+                _deriveAvailabilities(batch, previewIndex)
+                self.batchLoaded.emit(batch)
+        finally:
+            db.close()
+        self.finished.emit(summary)
+
+
 class MapScene(QGraphicsScene):
 
     projectChanged = pyqtSignal(str)
     
     aerialsLoaded = pyqtSignal(list)
 
+    aerialsSnapshot = pyqtSignal(str)  # for the web view, see web_protocol
+
+    aerialsDelta = pyqtSignal(str)  # for the web view, see web_protocol
+
     attackDataLoaded = pyqtSignal(list)
 
     areaOfInterestLoaded = pyqtSignal(list)
@@ -75,14 +209,89 @@ class MapScene(QGraphicsScene):
 
     noAerialsVisible = pyqtSignal()
 
+    # Limit the time spent per event loop iteration for creating the items of aerials that have come into view.
+    __maxMaterializedPerPass = 200
+
+    # Store transforms at most this often while aerials are being dragged or zoomed [ms].
+    __flushInterval = 1000
+
+    # Send changes of aerials to the web view at most this often [ms].
+    __deltaInterval = 100
+
+    # Highlighted aerials blink with this period [ms].
+    __blinkInterval = 500
+
+    # Check this often whether others have changed aerials in the DB, e.g. on a shared drive [ms].
+    __pollInterval = 2000
+
     def __init__(self, *args, epsg: int, config: configparser.ConfigParser, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.__wcs = osr.SpatialReference()
         self.__wcs.ImportFromEPSG(epsg)
         self.__db = None
+        self.__writer: project_db.WriteBehind | None = None
+        self.__flushTimer = QTimer(self)
+        self.__flushTimer.setSingleShot(True)
+        self.__flushTimer.setInterval(__class__.__flushInterval)
+        self.__flushTimer.timeout.connect(self.__flushWrites)
+        # A single clock for all highlighted aerials.
+        self.__blinkedOn = False
+        self.__blinkTimer = QTimer(self)
+        self.__blinkTimer.setInterval(__class__.__blinkInterval)
+        self.__blinkTimer.timeout.connect(self.__blink)
+        self.__changeFeed: project_db.ChangeFeed | None = None
+        self.__pollTimer = QTimer(self)
+        self.__pollTimer.setInterval(__class__.__pollInterval)
+        self.__pollTimer.timeout.connect(self.__applyChanges)
+        self.__feed = AerialsFeed()
+        self.__deltaTimer = QTimer(self)
+        self.__deltaTimer.setSingleShot(True)
+        self.__deltaTimer.setInterval(__class__.__deltaInterval)
+        self.__deltaTimer.timeout.connect(self.__emitAerialsDelta)
         self.__attackData = None
         self.__aoi = None
         self.__config = config
+        self.__occlusionCulled: list[AerialImage] = []
+        # Culling is costly, so it is redone only if images have changed, or if the view has left the rect culled before.
+        self.__occlusionValid = False
+        self.__occlusionRect = QRectF()
+        # All aerials of the project. Only those in or near the viewport have graphics items, indexed by their rows.
+        self.__table: AerialTable | None = None
+        self.__objects: dict[int, AerialObject] = {}
+        # Optionally, draw the points of aerials without items at once. Only the point under the mouse then gets items.
+        self.__pointLayer: PointLayer | None = None
+        if config.getboolean('VIEW', 'pointLayer', fallback=False):
+            self.__pointLayer = PointLayer()
+            self.addItem(self.__pointLayer)
+        self.__promoted: int | None = None
+        self.__viewedRect = QRectF()
+        self.__materializeTimer = QTimer(self)
+        self.__materializeTimer.setSingleShot(True)
+        self.__materializeTimer.timeout.connect(self.__materialize)
+        # State that items need to know when being created.
+        self.__contrast = ContrastEnhancement.clahe if claheAvailable else ContrastEnhancement.histogram
+        self.__highlighted: set[str] = set()
+        # As last set, to be applied to aerials loaded later on.
+        self.__usages: dict[Usage, bool] = {}
+        self.__visualizations: dict[Availability, Visualization] = {}
+        self.__filteredImageIds: set[str] = set()
+        self.__loader: _AerialsLoader | None = None
+        # Whether the loader has replaced the previous project yet.
+        self.__loadPrepared = False
+        self.__loadGeneration = 0
+        # Cancelled, but possibly still finishing their current batch.
+        self.__cancelledLoaders: list[_AerialsLoader] = []
+        self.__progress: QProgressDialog | None = None
+        # Connect these before any AerialObject does, so the table gets updated before them.
+        # highlightAerials and showAsImage are delivered to the objects of the aerials concerned only.
+        self.contrastEnhancementChanged.connect(self.__setContrastEnhancement)
+        self.visualizationChanged.connect(self.__setVisualization)
+        self.highlightAerials.connect(self.__highlight)
+        self.showAsImage.connect(self.__showAsImage)
+        # Collect them for the web view.
+        self.aerialFootPrintChanged.connect(self.__onAerialFootPrintChanged)
+        self.aerialAvailabilityChanged.connect(self.__onAerialAvailabilityChanged)
+        self.aerialUsageChanged.connect(self.__onAerialUsageChanged)
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
         super().keyPressEvent(event)
@@ -91,6 +300,20 @@ class MapScene(QGraphicsScene):
         if event.key() == Qt.Key_Escape:
             self.setFocusItem(None)
 
+    def helpEvent(self, event: QGraphicsSceneHelpEvent) -> None:
+        # Aerial items have no tool tips set, as formatting them for all would be costly. Format the one asked for.
+        view = self.views()[0]
+        for item in self.items(event.scenePos(), Qt.IntersectsItemShape, Qt.DescendingOrder, view.viewportTransform()):
+            image = item if isinstance(item, AerialImage) else item.image() if isinstance(item, AerialPoint) else None
+            toolTip = image.object.toolTip() if image is not None else item.clusterToolTip(event.scenePos()) if isinstance(item, PointLayer) else ''
+            if toolTip:
+                QToolTip.showText(event.screenPos(), toolTip, event.widget())
+                event.accept()
+                return
+            if item.toolTip():
+                break
+        super().helpEvent(event)
+
     @pyqtSlot()
     def selectAerialsFile(self):
         fileName = QFileDialog.getOpenFileName(None, "Load aerial meta data",
@@ -124,10 +347,299 @@ class MapScene(QGraphicsScene):
             self.__exportSelectedImages(Path(fileName))
 
     def unload(self):
+        self.__cancelLoading()
+        for loader in self.__cancelledLoaders:
+            loader.wait()
+        self.__pollTimer.stop()
         AerialImage.unload()
+        self.__flushWrites()
         if self.__db is not None:
             self.__db.close()
 
+    def itemsBoundingRect(self) -> QRectF:
+        # Include the aerials that currently have no items. The point layer spans the view only.
+        if self.__pointLayer is None:
+            rect = super().itemsBoundingRect()
+        else:
+            rect = QRectF()
+            for item in self.items():
+                if item is not self.__pointLayer:
+                    rect |= item.sceneBoundingRect()
+        if self.__table is not None and (bounds := self.__table.allBounds()) is not None:
+            rect |= QRectF(QPointF(*bounds[:2]), QPointF(*bounds[2:]))
+        return rect
+
+    def visibleAerialsBoundingRect(self) -> QRectF:
+        if self.__table is not None and (bounds := self.__table.visibleBounds()) is not None:
+            return QRectF(QPointF(*bounds[:2]), QPointF(*bounds[2:]))
+        return QRectF()
+
+    def contrastEnhancement(self) -> ContrastEnhancement:
+        return self.__contrast
+
+    def isHighlighted(self, imgId: str) -> bool:
+        return imgId in self.__highlighted
+
+    def isBlinkedOn(self) -> bool:
+        return self.__blinkedOn
+
+    def setViewedRect(self, sceneRect: QRectF) -> None:
+        # To be called by the view before painting. Items get created and released with some delay, so panning stays smooth.
+        if sceneRect != self.__viewedRect:
+            self.__viewedRect = sceneRect
+            if self.__pointLayer is not None:
+                self.__pointLayer.setViewedRect(sceneRect)
+            self.__materializeTimer.start(50)
+
+    def promotePoint(self, row: int | None) -> None:
+        # Called by the point layer for the point under the mouse, which gets items to interact with. Others get released.
+        if row != self.__promoted:
+            self.__promoted = row
+            if row is not None and row not in self.__objects and self.__table is not None and self.__writer is not None:
+                self.__createObject(row)
+                self.__updatePointLayer()
+            self.__materializeTimer.start(50)
+
+    def invalidateOcclusion(self) -> None:
+        # Called by images whose geometry, stacking, opacity, or visibility has changed.
+        self.__occlusionValid = False
+
+    def cullOccludedImages(self, exposedSceneRect: QRectF) -> None:
+        # To be called by the view before painting exposedSceneRect.
+        # Over dense mosaics, most of the stacked images are hidden by opaque ones above them.
+        if self.__occlusionValid and self.__occlusionRect.contains(exposedSceneRect):
+            return
+        # Cull a margin around the viewed rect, too, so hovering and panning a bit do not need culling again.
+        rect = self.__viewedRect.united(exposedSceneRect)
+        margin = max(rect.width(), rect.height()) / 2
+        rect.adjust(-margin, -margin, margin, margin)
+        self.__occlusionValid = True
+        self.__occlusionRect = rect
+        images = [item for item in self.items(rect, Qt.IntersectsItemBoundingRect, Qt.DescendingOrder)
+                  if isinstance(item, AerialImage) and item.isVisible()]
+        # Images outside rect will be culled again before being painted.
+        # Still, do not let them keep clips that may have become outdated.
+        current = set(images)
+        for image in self.__occlusionCulled:
+            if image not in current:
+                image.setOcclusionClip(None)
+        cullOccludedImages(images, rect)
+        self.__occlusionCulled = images
+
+    def __materialize(self) -> None:
+        table = self.__table
+        if table is None or self.__writer is None or self.__viewedRect.isEmpty():
+            return
+        rect = self.__viewedRect
+
+        if self.__pointLayer is None:
+            shown = table.pointVisible | table.imageVisible
+        else:
+            # Points are drawn by the layer, unless they blink or are under the mouse.
+            wanted = np.zeros(len(table), dtype=bool)
+            wanted[[row for imgId in self.__highlighted if (row := table.row(imgId)) is not None]] = True
+            if self.__promoted is not None:
+                wanted[self.__promoted] = True
+            shown = table.imageVisible | wanted & table.pointVisible
+
+        def shownNear(factor: float) -> np.ndarray:
+            margin = max(rect.width(), rect.height()) * factor
+            near = rect.adjusted(-margin, -margin, margin, margin)
+            # In memory, as this runs on every change of the viewport. The spatial index of the DB serves queries without a loaded table.
+            return table.intersecting(near.left(), near.top(), near.right(), near.bottom()) & shown
+
+        # Create items within half a viewport around it, but release them only beyond a whole one,
+        # so panning back and forth does not re-create them over and over.
+        toKeep = shownNear(1.)
+        nObjects = len(self.__objects)
+        for row, obj in list(self.__objects.items()):
+            if not toKeep[row] and not obj.isPinned():
+                self.__releaseObject(row)
+        self.__occlusionCulled = [image for image in self.__occlusionCulled if image.scene() is self]
+        toCreate = shownNear(.5)
+        toCreate[list(self.__objects)] = False
+        rows = np.flatnonzero(toCreate)
+        if len(self.__objects) != nObjects or len(rows):
+            self.__updatePointLayer()
+        if not len(rows):
+            return
+        # Closest to the center of the view first.
+        center = rect.center()
+        rows = rows[np.argsort(((table.pos[rows] - (center.x(), center.y())) ** 2).sum(axis=1))]
+        for row in rows[:__class__.__maxMaterializedPerPass].tolist():
+            self.__createObject(row)
+        if len(rows) > __class__.__maxMaterializedPerPass:
+            self.__materializeTimer.start(0)
+
+    def __createObject(self, row: int) -> AerialObject:
+        table = self.__table
+        assert table is not None
+        obj = self.__objects[row] = AerialObject(self, table, row)
+        table.materialized[row] = True
+        return obj
+
+    def __releaseObject(self, row: int) -> None:
+        table = self.__table
+        assert table is not None
+        self.__objects.pop(row).release()
+        table.materialized[row] = False
+
+    def __updatePointLayer(self) -> None:
+        if self.__pointLayer is not None:
+            self.__pointLayer.update()
+
+    @pyqtSlot(ContrastEnhancement)
+    def __setContrastEnhancement(self, contrast: ContrastEnhancement) -> None:
+        self.__contrast = contrast
+
+    @pyqtSlot(dict, dict, set)
+    def __setVisualization(self, usages: dict[Usage, bool], visualizations: dict[Availability, Visualization], filteredImageIds: set[str]):
+        self.__usages.update(usages)
+        self.__visualizations.update(visualizations)
+        self.__filteredImageIds = filteredImageIds
+        table = self.__table
+        if table is None:
+            return
+        nVisible = table.nVisible()
+        imageVisible, pointVisible = table.imageVisible.copy(), table.pointVisible.copy()
+        self.__setFiltered(range(len(table)))
+        self.__applyVisualization(range(len(table)), usages, visualizations)
+        # Only the items of aerials whose visibility has changed.
+        changed = (table.imageVisible != imageVisible) | (table.pointVisible != pointVisible)
+        for row, obj in self.__objects.items():
+            if changed[row]:
+                obj.syncVisibility()
+        self.__updatePointLayer()
+        self.addAerialsVisible.emit(table.nVisible() - nVisible)
+        self.__materializeTimer.start(0)
+
+    def __setFiltered(self, rows: range) -> None:
+        table = self.__table
+        assert table is not None
+        if not self.__filteredImageIds:
+            table.filtered[rows.start:rows.stop] = True
+        elif len(rows) > len(self.__filteredImageIds):
+            table.filtered[rows.start:rows.stop] = False
+            table.filtered[[row for imgId in self.__filteredImageIds
+                            if (row := table.row(imgId)) is not None and row in rows]] = True
+        else:
+            table.filtered[rows.start:rows.stop] = [imgId in self.__filteredImageIds for imgId in table.ids[rows.start:rows.stop]]
+
+    def __applyVisualization(self, rows: range | np.ndarray, usages: dict[Usage, bool] | None = None,
+                             visualizations: dict[Availability, Visualization] | None = None) -> None:
+        # Aerials whose usage or availability is not given keep their visibility.
+        table = self.__table
+        assert table is not None
+        usages = self.__usages if usages is None else usages
+        visualizations = self.__visualizations if visualizations is None else visualizations
+        rows = slice(rows.start, rows.stop) if isinstance(rows, range) else rows
+        # Look-up tables indexed by the codes of usage and availability: -1 if not given.
+        usageIsOn = np.full(len(Usage), -1, dtype=np.int8)
+        for usage, isOn in usages.items():
+            usageIsOn[usage] = isOn
+        visualization = np.full(len(Availability), -1, dtype=np.int8)
+        for availability, vis in visualizations.items():
+            visualization[availability] = vis.value
+        isOn = usageIsOn[table.usage[rows]]
+        vis = visualization[table.availability[rows]]
+        given = (isOn >= 0) & (vis >= 0)
+        shown = (isOn == 1) & table.filtered[rows]
+        table.imageVisible[rows] = np.where(given, shown & (vis == Visualization.asImage.value), table.imageVisible[rows])
+        table.pointVisible[rows] = np.where(given, shown & (vis == Visualization.asPoint.value), table.pointVisible[rows])
+
+    @pyqtSlot(set)
+    def __highlight(self, imgIds: set[str]) -> None:
+        previous, self.__highlighted = self.__highlighted, set(imgIds)
+        table = self.__table
+        if table is not None:
+            # Aerials without objects get highlighted when materialized.
+            for ids, highlighted in (previous - self.__highlighted, False), (self.__highlighted, True):
+                for imgId in ids:
+                    if (row := table.row(imgId)) is not None and (obj := self.__objects.get(row)) is not None:
+                        obj.setHighlighted(highlighted)
+        if not self.__highlighted:
+            self.__blinkTimer.stop()
+            self.__blinkedOn = False
+        elif not self.__blinkTimer.isActive():
+            self.__blinkTimer.start()
+        # Release the items of aerials that are no longer highlighted, if far from the viewport.
+        self.__materializeTimer.start(50)
+
+    @pyqtSlot()
+    def __blink(self) -> None:
+        self.__blinkedOn = not self.__blinkedOn
+        table = self.__table
+        if table is None:
+            return
+        for imgId in self.__highlighted:
+            if (row := table.row(imgId)) is not None and (obj := self.__objects.get(row)) is not None:
+                obj.updateItems()
+
+    @pyqtSlot()
+    def __flushWrites(self) -> None:
+        self.__flushTimer.stop()
+        if self.__writer is not None:
+            self.__writer.flush()
+
+    @pyqtSlot()
+    def __applyChanges(self) -> None:
+        """Apply the changes of aerials that others have stored in the DB."""
+        table = self.__table
+        if table is None or self.__changeFeed is None:
+            return
+        try:
+            changed = self.__changeFeed.poll()
+        except sqlite3.Error as ex:
+            # e.g. while the shared drive is unreachable. Try again with the next poll.
+            logger.warning(f'Polling the data base for changes failed: {ex}')
+            return
+        nVisible = table.nVisible()
+        rows = []
+        for imgId, aerial in changed.items():
+            row = table.row(imgId)
+            # Aerials of other spreadsheets, of batches not loaded yet, and those changed here are up to date, or will be.
+            if row is None or table.isPending(row) or table.isStored(row, aerial):
+                continue
+            usage, availability = table.usage[row], table.availability[row]
+            table.setStored(row, aerial)
+            table.availability[row] = deriveAvailability(imgId, aerial.path, aerial.previewRect, AerialImage.previewIndex)
+            # The items read their state from the table when created.
+            if row in self.__objects:
+                self.__releaseObject(row)
+            if aerial.usage != usage:
+                self.aerialUsageChanged.emit(imgId, int(aerial.usage))
+            self.aerialFootPrintChanged.emit(imgId, table.footprint(row))
+            if table.availability[row] != availability:
+                absPath = ''
+                if aerial.path is not None:
+                    rootDir = AerialImage.previewRootDir if aerial.previewRect else AerialImage.imageRootDir
+                    absPath = str(rootDir / aerial.path)
+                self.aerialAvailabilityChanged.emit(imgId, int(table.availability[row]), absPath)
+            rows.append(row)
+        if not rows:
+            return
+        logger.info(f'{len(rows)} aerials changed by others.')
+        self.__applyVisualization(np.array(rows))
+        self.__occlusionCulled = [image for image in self.__occlusionCulled if image.scene() is self]
+        self.__updatePointLayer()
+        self.addAerialsVisible.emit(table.nVisible() - nVisible)
+        self.__materializeTimer.start(0)
+
+    @pyqtSlot(str, bool)
+    def __showAsImage(self, imgId: str, show: bool) -> None:
+        table = self.__table
+        if table is None or self.__writer is None or (row := table.row(imgId)) is None:
+            return
+        nVisible = table.nVisible()
+        table.imageVisible[row] = show
+        table.pointVisible[row] = not show
+        self.addAerialsVisible.emit(table.nVisible() - nVisible)
+        if (obj := self.__objects.get(row)) is None:
+            # The web view may ask for any aerial, even if far from the viewport.
+            obj = self.__createObject(row)
+            self.__updatePointLayer()
+        obj.showAsImage(show)
+
     def __loadAoiFile(self, fileName: Path) -> None:
         def error(msg):
             __class__.__error("Erroneous Area of Interest", msg)
@@ -181,7 +693,7 @@ class MapScene(QGraphicsScene):
 
     def __loadAerialsFile(self, fileName: Path) -> None:
         logger.info(f'Spreadsheet with image meta data to load: {fileName}')
-        dbPath = fileName.with_suffix('.sqlite')
+        dbPath = ingest.dbPathFor(fileName)
         rmDb = False
         if dbPath.exists():
             button = QMessageBox.question(
@@ -192,31 +704,36 @@ class MapScene(QGraphicsScene):
             if button == QMessageBox.Discard:
                 rmDb = True
 
-        dfs = pd.read_excel(str(fileName), sheet_name=None, true_values=['Ja', 'ja'], false_values=['Nein', 'nein'])
-        sheet_names = 'Geo_Abfrage_SQL', 'Geo_Abfrage'
-        for sheet_name in sheet_names:
-            df = dfs.get(sheet_name)
-            if df is not None:
-                break
-        else:
-            __class__.__error('Load aerial image meta data', f"{fileName} contains no sheet named {', '.join(sheet_names)}")
-            return
-        if not self.__cleanAerialData(df, sheet_name):
-            return
-
-        AerialImage.previewRootDir = Path(self.__config['PREVIEWS']['rootDir'])
-        if not AerialImage.previewRootDir.is_absolute():
-            AerialImage.previewRootDir = fileName.parent / AerialImage.previewRootDir
-        AerialImage.imageRootDir = Path(self.__config['IMAGES']['rootDir'])
-        if not AerialImage.imageRootDir.is_absolute():
-            AerialImage.imageRootDir = fileName.parent / AerialImage.imageRootDir
-        # Hack
-        if not AerialImage.imageRootDir.exists() and AerialImage.imageRootDir.name.lower() == 'images' and AerialImage.imageRootDir.with_name('Bilder').exists():
-            AerialImage.imageRootDir = AerialImage.imageRootDir.with_name('Bilder')
-
+        self.__cancelLoading()
+        # Keep the current project until the spreadsheet has been parsed successfully.
+        self.__loadPrepared = False
+        loader = self.__loader = _AerialsLoader(fileName, dbPath, rmDb, self.__config, self.__wcs, self.__loadGeneration)
+        progress = self.__progress = QProgressDialog(f'Loading {fileName.name} ...', 'Cancel', 0, 0, self.views()[0])
+        progress.setWindowTitle('Load aerial image meta data')
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(loader.cancel)
+        loader.progressed.connect(self.__onLoadProgressed)
+        loader.prepared.connect(self.__onLoadPrepared)
+        loader.batchLoaded.connect(self.__onBatchLoaded)
+        loader.finished.connect(self.__onLoadFinished)
+        loader.failed.connect(self.__onLoadFailed)
+        loader.start()
+
+    def __closeProject(self, dbPath: Path, rmDb: bool) -> None:
+        for loader in self.__cancelledLoaders:
+            if loader.dbPath == dbPath:
+                # Its DB connection must be closed before the DB may get deleted, and it must not insert aerials concurrently.
+                loader.wait()
         if self.__aoi is not None:
             self.removeItem(self.__aoi)
+        if self.__pointLayer is not None:
+            self.__pointLayer.setTable(None)
+            self.removeItem(self.__pointLayer)
+        self.__promoted = None
         # clear() removes all items and deletes them, but does not call their itemChange before...
+        self.__occlusionCulled = []
+        self.__objects = {}
+        self.__table = None
         self.clear()
         # ... so we need to explicitly reset MainWindow.__nVisibleAerials
         self.noAerialsVisible.emit()
@@ -227,84 +744,140 @@ class MapScene(QGraphicsScene):
         gc.collect()
         if self.__aoi is not None:
             self.addItem(self.__aoi)
+        if self.__pointLayer is not None:
+            self.addItem(self.__pointLayer)
+        self.__flushWrites()
+        self.__pollTimer.stop()
+        self.__changeFeed = None
+        self.__deltaTimer.stop()
+        self.__feed.reset()
+        self.__writer = None
         if self.__db is not None:
             self.__db.close()
             self.__db = None
         if rmDb:
             dbPath.unlink()
-        self.__db = sqlite3.connect(dbPath, isolation_level=None)
-        self.__db.execute('PRAGMA busy_timeout = 5000')
-        self.__db.execute('PRAGMA foreign_keys = ON')
-        AerialImage.createTables(self.__db)
-
-        xlsImgFiles = []
-        shouldBeMissing = []
-        shouldBeThere = []
-        aerialObjects = []
-        # Speed up the creating of a new DB, especially if it is located on a network drive.
-        # Also, errors during setup will leave an existing DB in its original state.
-        self.__db.execute('BEGIN TRANSACTION')
-        for idx, row in enumerate(df.itertuples(index=False)):
-            imgId = f'{row.Datum.year}-{row.Datum.month:02}-{row.Datum.day:02}_{row.Sortie}_{row.Bildnr}.ecw'
-            if not (AerialImage.imageRootDir / imgId).exists():
-                imgId = (Path(row.Sortie) / f'{row.Bildnr}.ecw').as_posix()
-            imgFilePath = AerialImage.imageRootDir / imgId
-            if not row.LBDB and imgFilePath.exists():
-                shouldBeMissing.append(imgFilePath.name)
-            elif row.LBDB and not imgFilePath.exists():
-                shouldBeThere.append(imgFilePath.name)
-            xlsImgFiles.append(imgFilePath)
-            csDb = osr.SpatialReference()
-            csDb.ImportFromEPSG(row.EPSG_Code)
-            assert csDb.IsProjected() or csDb.IsGeographic()
-            db2wcs = osr.CoordinateTransformation(csDb, self.__wcs)
-            x, y = row.x, row.y
-            if csDb.EPSGTreatsAsNorthingEasting() or csDb.EPSGTreatsAsLatLong():
-                x, y = y, x
-            wcsCtr = db2wcs.TransformPoint(x, y)
-            if idx == 0:
-                # Consider the scale distortion of Web Mercator.
-                csWgs84Cartesian = osr.SpatialReference()
-                csWgs84Cartesian.ImportFromEPSG(4978)
-                wcs2cartesian = osr.CoordinateTransformation(self.__wcs, csWgs84Cartesian)
-                pt2 = np.array(wcsCtr)
-                pt2[0] += 1000
-                cartes1 = np.array(wcs2cartesian.TransformPoint(*wcsCtr))
-                cartes2 = np.array(wcs2cartesian.TransformPoint(*pt2))
-                AerialImage.scaleCartesian2map = float(1000. / np.linalg.norm(cartes2 - cartes1))
-            # WCS -> CS QGraphicsScene: invert y-coordinate
-            aerialObjects.append(AerialObject(self, QPointF(wcsCtr[0], -wcsCtr[1]), str(imgId), row, self.__db))
-        self.__db.execute('COMMIT TRANSACTION')
+        self.__db = project_db.connect(dbPath, self.__config.get('DATABASE', 'journalMode', fallback='DELETE'))
+        project_db.createTables(self.__db)
+        self.__writer = project_db.WriteBehind(self.__db, self.__flushTimer.start)
+        self.__changeFeed = project_db.ChangeFeed(self.__db)
+        self.__pollTimer.start()
+
+    def __cancelLoading(self) -> None:
+        # Do not wait for the loader here, as it may be in the middle of a batch. Instead, drop whatever it still sends.
+        self.__loadGeneration += 1
+        self.__cancelledLoaders = [loader for loader in self.__cancelledLoaders if loader.isRunning()]
+        if self.__loader is not None:
+            self.__loader.cancel()
+            self.__cancelledLoaders.append(self.__loader)
+            self.__loader = None
+        if self.__progress is not None:
+            self.__progress.close()
+            self.__progress = None
+
+    def __isCurrentLoad(self) -> bool:
+        return self.sender().generation == self.__loadGeneration
+
+    @pyqtSlot(str, int, int)
+    def __onLoadProgressed(self, label: str, value: int, maximum: int) -> None:
+        if not self.__isCurrentLoad() or self.__progress is None:
+            return
+        self.__progress.setLabelText(label)
+        self.__progress.setMaximum(maximum)
+        self.__progress.setValue(value)
+
+    @pyqtSlot(object)
+    def __onLoadPrepared(self, context: _LoadContext) -> None:
+        if not self.__isCurrentLoad():
+            return
+        loader = self.__loader
+        assert loader is not None
+        try:
+            self.__closeProject(loader.dbPath, loader.discardDb)
+        except Exception as ex:
+            logger.exception('Opening the data base failed.')
+            self.__cancelLoading()
+            __class__.__error('Open data base', str(ex))
+            return
+        self.__loadPrepared = True
+        # The scene has no aerial items until it receives the first batch, so nobody uses these meanwhile.
+        AerialImage.imageRootDir = context.imageRootDir
+        AerialImage.previewRootDir = context.previewRootDir
+        AerialImage.imageIndex = context.imageIndex
+        AerialImage.previewIndex = context.previewIndex
+        AerialImage.scaleCartesian2map = context.scaleCartesian2map
+        self.projectChanged.emit(context.projectName)
+        # Keep the GUI responsive, and show aerials as soon as their batch has been loaded.
+        loader.proceed()
+
+    @pyqtSlot(object)
+    def __onBatchLoaded(self, batch: AerialTable) -> None:
+        if not self.__isCurrentLoad():
+            return
+        if self.__table is None:
+            self.__table = batch
+            batch.writer = self.__writer
+            if self.__pointLayer is not None:
+                self.__pointLayer.setTable(batch)
+            nVisible = 0
+            begin = 0
+        else:
+            nVisible = self.__table.nVisible()
+            begin = len(self.__table)
+            self.__table.extend(batch)
+        self.__setFiltered(range(begin, len(self.__table)))
+        self.__applyVisualization(range(begin, len(self.__table)))
+        self.__updatePointLayer()
+        self.addAerialsVisible.emit(self.__table.nVisible() - nVisible)
+        if not begin:
+            for view in self.views():
+                view.fitInView(self.itemsBoundingRect(), Qt.KeepAspectRatio)
+        self.__materializeTimer.start(0)
+
+    @pyqtSlot(object)
+    def __onLoadFinished(self, summary: _LoadSummary) -> None:
+        if not self.__isCurrentLoad():
+            return
+        self.__cancelLoading()
+        if not self.__loadPrepared:
+            # Cancelled while parsing. The previous project is still there.
+            return
+        if self.__table is None:
+            self.__table = AerialTable([], [], np.empty((0, 2)), [])
+        table = self.__table
 
         for view in self.views():
             view.fitInView(self.itemsBoundingRect(), Qt.KeepAspectRatio)
 
         msgs = []
-        if shouldBeMissing:
+        if summary.shouldBeMissing:
             msgs.append('{} out of {} files should be missing according to {}, but they are present: {}'.format(
-                len(shouldBeMissing), len(xlsImgFiles), sheet_name, ', '.join(shouldBeMissing)))
-        if shouldBeThere:
+                len(summary.shouldBeMissing), summary.nAerials, summary.sheetName, ', '.join(summary.shouldBeMissing)))
+        if summary.shouldBeThere:
             msgs.append('{} out of {} files should be present according to {}, but they are missing: {}'.format(
-                len(shouldBeThere), len(xlsImgFiles), sheet_name, ', '.join(shouldBeThere)))
+                len(summary.shouldBeThere), summary.nAerials, summary.sheetName, ', '.join(summary.shouldBeThere)))
         for msg in msgs:
             logger.warning(msg)
             QMessageBox.warning(self.views()[0], 'Inconsistency', _truncateMsg(msg))
 
-        images = [el.image() for el in aerialObjects]
-        availabilityCounts = collections.Counter((image.availability() for image in images))
-        title = 'Availabilities of {} aerials'.format(len(aerialObjects))
+        availabilityCounts = collections.Counter(Availability(el) for el in table.availability.tolist())
+        title = 'Availabilities of {} aerials'.format(len(table))
+        if len(table) < summary.nAerials:
+            title += ' (loading cancelled after {} of {})'.format(len(table), summary.nAerials)
         msgs = [f'{el.name}:\t{availabilityCounts[el]}' for el in reversed(Availability)]
         logger.info(title + ': ' + ','.join(msgs))
         QMessageBox.information(self.views()[0], title, title + '\n' + '\n'.join(msgs))
 
-        try:
-            zusammenfassung = pd.read_excel(str(fileName), sheet_name='Zusammenfassung', nrows=2)
-            projectName = str(zusammenfassung.columns[0])
-        except:
-            projectName = fileName.stem
-        self.projectChanged.emit(projectName)
+        self.__emitAerialsLoaded()
+        # Create the items in view, even if the view has not changed.
+        self.__materializeTimer.start(0)
 
-        self.emitAerialsLoaded(images)
+    @pyqtSlot(str, str)
+    def __onLoadFailed(self, title: str, msg: str) -> None:
+        if not self.__isCurrentLoad():
+            return
+        self.__cancelLoading()
+        __class__.__error(title, msg)
 
     def __loadAttackDataFile(self, fileName: Path) -> None:
         def date2str(arg: str | datetime.datetime) -> str:
@@ -355,26 +928,52 @@ class MapScene(QGraphicsScene):
         df = pd.DataFrame(namedTuples)
         df.to_excel(fileName, sheet_name='Selected aerials', index=False, freeze_panes=(1, 0))
 
-    def emitAerialsLoaded(self, images: list[AerialImage] | None = None) -> None:
-        if self.__db is None:
+    def __emitAerialsLoaded(self) -> None:
+        # Once per project. A re-loaded web page only gets a snapshot.
+        if self.__db is None or self.__table is None:
             return
-        if images is None:
-            images = [item for item in self.items() if isinstance(item, AerialImage)]
+        table = self.__table
         aerials = {}
-        cursor = self.__db.execute('SELECT * FROM aerials')
-        iId = [el[0] for el in cursor.description].index('id')
-        for row in cursor:
-            aerial = {name: val for (name, *_), val in zip(cursor.description, row)
-                      if name not in ('trafo', 'scenePos', 'previewRect')}
-            aerial['meta'] = json.loads(aerial['meta'])
-            aerials[row[iId]] = aerial
-
-        for image in images:
-            imgId, footprint = image.id(), image.footprint()
-            aerials[imgId].update([('footprint', footprint),
-                                   ('availability', int(image.availability()))])
+        # Include the latest locks.
+        self.__flushWrites()
+        for imgId, usage, trafoLocked, path, meta in self.__db.execute('SELECT id, usage, trafoLocked, path, meta FROM aerials'):
+            aerials[imgId] = {'id': imgId, 'usage': usage, 'trafoLocked': trafoLocked, 'path': path, 'meta': json.loads(meta)}
 
         self.aerialsLoaded.emit(list(aerials.values()))
+        # The web view gets them in one piece.
+        self.__deltaTimer.stop()
+        self.aerialsSnapshot.emit(self.__feed.snapshot(table, lambda: ((imgId, aerial['meta']) for imgId, aerial in aerials.items())))
+
+    @pyqtSlot()
+    def emitAerialsSnapshot(self) -> None:
+        # e.g. for a re-loaded web page, or if it has missed a delta.
+        if self.__db is None or self.__table is None:
+            return
+        self.__deltaTimer.stop()
+        db = self.__db
+        self.aerialsSnapshot.emit(self.__feed.snapshot(
+            self.__table, lambda: ((imgId, json.loads(meta)) for imgId, meta in db.execute('SELECT id, meta FROM aerials'))))
+
+    @pyqtSlot(str, list)
+    def __onAerialFootPrintChanged(self, imgId: str, footprint: list[dict[str, float]]) -> None:
+        self.__feed.changeFootprint(imgId, footprint)
+        self.__deltaTimer.start()
+
+    @pyqtSlot(str, int, str)
+    def __onAerialAvailabilityChanged(self, imgId: str, availability: int, path: str) -> None:
+        self.__feed.change(imgId, availability=availability, path=path)
+        self.__deltaTimer.start()
+
+    @pyqtSlot(str, int)
+    def __onAerialUsageChanged(self, imgId: str, usage: int) -> None:
+        self.__feed.change(imgId, usage=usage)
+        self.__deltaTimer.start()
+
+    @pyqtSlot()
+    def __emitAerialsDelta(self) -> None:
+        # Coalesces all changes since the last one, e.g. while an aerial is being dragged.
+        if (delta := self.__feed.takeDelta()) is not None:
+            self.aerialsDelta.emit(delta)
 
     def emitAttackDataLoaded(self):
         if self.__attackData is not None:
@@ -404,39 +1003,3 @@ class MapScene(QGraphicsScene):
         logger.error(msg)
         QMessageBox.critical(None, title, msg)
         return False
-
-    @staticmethod
-    def __cleanAerialData(df: pd.DataFrame, sheet_name: str) -> bool:
-        def error(msg):
-            return __class__.__error("Erroneous Coordinate Reference System", msg)
-        fulls = 'Sortie Spot Bildnr Datum MASSTAB QU Acc BLänder Abd LBDB Quelle x y xWGS84 yWGS84'.split()
-        fulls = {elem.lower() : elem for elem in fulls}
-        # Projekte LBDB\Meeting_2021-06-10_Testprojekte\Testprojekt1 and Testprojekt2 contain a column with EPSG-Code, either named 'EPSG-Code', or 'EPSGCode'.
-        # More fuzz: Graz contains columns RechtsGK3, HochGK3, RechtsGK4, HochGK4. Both GK4 columns are empty. GK3 columns are filled, but correspond to EPSG:31468 i.e. zone 4, not 3!
-        abbrs = ('epsg', 'EPSG_Code'), ('radius', 'Radius_Bild'), ('rechtsgk3', 'RechtsGK'), ('hochgk3', 'HochGK')
-        rename = {}
-        empty = []
-        for pres in df.columns:
-            if not df[pres].count():
-                empty.append(pres)
-            elif pres.lower() in fulls:
-                rename[pres] = fulls[pres.lower()]
-            else:
-                for abbr, full in abbrs:
-                    if pres.lower() == abbr.lower():
-                        rename[pres] = full
-                        break
-        df.drop(columns=empty, inplace=True)
-        df.rename(columns={old: new for old, new in rename.items() if old != new}, inplace=True)
-        df['Datum'] = df['Datum'].dt.date  # strip time of day
-        if {'xWGS84', 'yWGS84'}.issubset(df.columns):
-            df['EPSG_Code'] = [4326] * len(df)
-            df.rename(columns={'xWGS84': 'x', 'yWGS84': 'y'}, inplace=True)
-        elif 'EPSG_Code' in df.columns:
-            assert {'x', 'y'}.issubset(df.columns)
-        elif {'RechtsGK', 'HochGK'}.issubset(df.columns):
-            df['EPSG_Code'] = [31468] * len(df)
-            df.rename(columns={'RechtsGK': 'x', 'HochGK': 'y'}, inplace=True)
-        else:
-            return error(f"{sheet_name} seems to provide no information on coordinate system. Columns are: {', '.join(df.columns)}")
-        return True
@@ -147,6 +147,8 @@ class MapView(QGraphicsView):
             exposedWcsRect = QRectF(exposedSceneRect.left(), -exposedSceneRect.top(),
                                     exposedSceneRect.width(), -exposedSceneRect.height())
             self.__readThread.requestImage(exposedWcsRect, pxPerMeter)
+        self.scene().setViewedRect(self.mapToScene(self.viewport().rect()).boundingRect())
+        self.scene().cullOccludedImages(self.mapToScene(event.region().boundingRect()).boundingRect())
         super().paintEvent(event)
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
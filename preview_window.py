@@ -39,6 +39,7 @@ else:
     claheAvailable = True
 
 from . import GdalPushLogHandler
+from .dataset_pool import datasetPool
 
 
 class GraphicsView(QGraphicsView):
@@ -189,8 +190,7 @@ class PreviewWindow(FormBase):
         assert imgPath.exists()
         self.setCursor(Qt.WaitCursor)
         try:
-            with GdalPushLogHandler():
-                ds = gdal.Open(str(imgPath))
+            with GdalPushLogHandler(), datasetPool.open(imgPath) as ds:
                 img = QImage(ds.RasterXSize, ds.RasterYSize, QImage.Format_RGBA8888)
                 img.fill(Qt.white)
                 ptr = img.scanLine(0)
@@ -0,0 +1,474 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Schema of the project data base, and bulk access to it while loading.
+
+The data base may reside on a network drive, where each statement is a round trip.
+Hence, read the state of all stored aerials with one query, and insert new ones with one statement per batch.
+
+Geometry is stored in typed columns, and so are the commonly used columns of the spreadsheet, so SQL can filter on them.
+Data bases of older versions stored geometry as JSON text. They get upgraded when opened.
+
+The bounding rectangles of the aerials' images in scene coordinates are indexed with an R*Tree, if SQLite has been built with it.
+Loading updates them for all aerials of the spreadsheet, and WriteBehind for transformed ones.
+They serve spatial queries without a loaded AerialTable, e.g. from scripts. The scene queries its table in memory instead.
+
+Several operators may work on the same data base at once, e.g. on a shared drive.
+Triggers log the aerials whose state has changed, so ChangeFeed can tell those changed by others without reading all of them.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+import datetime
+import enum
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import sys
+from typing import Final, NamedTuple
+
+from .dataset_pool import RasterMeta
+
+logger: Final = logging.getLogger(__name__)
+
+# Width of the pixmaps of aerials, to which the transforms stored in the DB refer.
+pixMapWidth: Final = 3000  # Approx. width of a microfilm scan, it seems.
+
+# Incremented with each change of the schema, and stored as PRAGMA user_version.
+# 0: scenePos, trafo, and previewRect as JSON text.
+_schemaVersion: Final = 1
+
+_rasterMetaColumns: Final = dict(zip(RasterMeta._fields, ('rasterWidth', 'rasterHeight', 'bandCount', 'overviewCount', 'fileSize')))
+
+# Spreadsheet column -> DB column. The spreadsheet rows are stored completely in column meta, too.
+# File systems of network drives, as listed in /proc/mounts.
+_networkFileSystems: Final = frozenset({'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', 'fuse.sshfs'})
+
+_metaColumns: Final = {'Sortie': 'sortie', 'Bildnr': 'bildnr', 'Datum': 'datum', 'MASSTAB': 'masstab', 'LBDB': 'lbdb'}
+
+# Changes of these get logged in aerialChanges.
+_trackedColumns: Final = ('usage', 'posX', 'posY', 'm11', 'm12', 'm21', 'm22', 'dx', 'dy', 'trafoLocked', 'path',
+                          'previewLeft', 'previewTop', 'previewWidth', 'previewHeight', 'previewRotationCcw')
+
+# Keep the change log this long [d]. Open projects poll it every few seconds.
+_changeLogDays: Final = 1
+
+_aerialColumns: Final = ('id', 'usage', 'posX', 'posY', 'm11', 'm12', 'm21', 'm22', 'dx', 'dy', 'trafoLocked', 'path',
+                         'previewLeft', 'previewTop', 'previewWidth', 'previewHeight', 'previewRotationCcw',
+                         *_metaColumns.values(), 'meta', *_rasterMetaColumns.values())
+
+
+class Usage(enum.IntEnum):
+    discarded = 0
+    unset = 1
+    selected = 2
+
+
+class PreviewRect(NamedTuple):
+    # Within the preview file [px].
+    left: int
+    top: int
+    width: int
+    height: int
+    # In multiples of 90°.
+    rotationCcw: int
+
+
+class StoredAerial(NamedTuple):
+    usage: Usage
+    scenePos: tuple[float, float]
+    # m11, m12, m21, m22, dx, dy, as in QTransform.
+    trafo: tuple[float, ...]
+    trafoLocked: bool
+    # Relative to imageRootDir if previewRect is None else to previewRootDir.
+    path: str | None
+    previewRect: PreviewRect | None
+    rasterMeta: RasterMeta | None
+
+
+def connect(dbPath: Path, journalMode: str | None = None) -> sqlite3.Connection:
+    """journalMode gets applied to new data bases only."""
+    isNew = not dbPath.exists() or not dbPath.stat().st_size
+    # Manage transactions explicitly.
+    db = sqlite3.connect(dbPath, isolation_level=None)
+    db.execute('PRAGMA busy_timeout = 5000')
+    db.execute('PRAGMA foreign_keys = ON')
+    onNetworkDrive = isOnNetworkDrive(dbPath)
+    if journalMode is not None and isNew:
+        if journalMode.lower() == 'wal' and onNetworkDrive:
+            logger.warning(f'{dbPath} is on a network drive, where journal mode WAL is unsafe. Using DELETE instead.')
+            journalMode = 'DELETE'
+        # The journal mode persists in the data base file, so other connections get it, too.
+        # Hence, do not change it for existing data bases, which others may be using in their mode.
+        # In WAL mode, committing needs no sync of the data base file, and readers do not block writers and vice versa.
+        mode, = db.execute(f'PRAGMA journal_mode = {journalMode}').fetchone()
+        if mode.lower() != journalMode.lower():
+            logger.warning(f'{dbPath} is in journal mode {mode} instead of {journalMode}.')
+    else:
+        mode, = db.execute('PRAGMA journal_mode').fetchone()
+    if mode.lower() == 'wal':
+        if onNetworkDrive:
+            logger.warning(f'{dbPath} is on a network drive, but in journal mode WAL. Using it from several computers at once may corrupt it, '
+                           'and changes by others may not show up. Set its journal mode to DELETE while nobody else uses it.')
+        # Still consistent after a power loss, only the last commits may get lost.
+        db.execute('PRAGMA synchronous = NORMAL')
+    return db
+
+
+def isOnNetworkDrive(path: Path) -> bool:
+    """Best guess. False if unknown."""
+    path = path.resolve()
+    if sys.platform == 'win32':
+        if str(path).startswith('\\\\'):
+            return True  # UNC path
+        import ctypes
+        DRIVE_REMOTE = 4
+        return ctypes.windll.kernel32.GetDriveTypeW(path.anchor) == DRIVE_REMOTE
+    try:
+        mounts = Path('/proc/mounts').read_text().splitlines()
+    except OSError:
+        return False
+    # The file system of the longest mount point that contains path.
+    fileSystem, longest = '', -1
+    for line in mounts:
+        _, mountPoint, fsType, *_ = line.split()
+        # Blanks are escaped as octal numbers.
+        mountPoint = mountPoint.replace('\\040', ' ')
+        if (path == Path(mountPoint) or Path(mountPoint) in path.parents) and len(mountPoint) > longest:
+            fileSystem, longest = fsType, len(mountPoint)
+    return fileSystem in _networkFileSystems
+
+
+def createTables(db: sqlite3.Connection) -> None:
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS usages
+        (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        ) ''')
+    db.executemany(
+        'INSERT OR IGNORE INTO usages(id, name) VALUES( ?, ? )',
+        ((el, el.name) for el in Usage))
+    tables = {name for name, in db.execute("SELECT name FROM sqlite_master WHERE type == 'table'")}
+    if 'aerials' not in tables:
+        _createAerialsTable(db)
+    else:
+        version, = db.execute('PRAGMA user_version').fetchone()
+        if version > _schemaVersion:
+            raise sqlite3.DatabaseError(f'The data base has been created by a newer version: schema {version} > {_schemaVersion}')
+        if version < 1:
+            _migrateFromJson(db)
+    db.execute(f'PRAGMA user_version = {_schemaVersion}')
+    try:
+        # id is the rowid of aerials.
+        db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS aerialBounds USING rtree(id, minX, maxX, minY, maxY)')
+    except sqlite3.OperationalError as ex:
+        logger.info(f'Spatial queries will be slower, as there is no spatial index: {ex}')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS aerialChanges
+        (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL,
+            time REAL NOT NULL DEFAULT (julianday('now'))
+        ) ''')
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS aerialChanged AFTER UPDATE OF {', '.join(_trackedColumns)} ON aerials
+        WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in _trackedColumns)}
+        BEGIN
+            INSERT INTO aerialChanges (id) VALUES (NEW.id);
+        END''')
+    db.execute(f"DELETE FROM aerialChanges WHERE time < julianday('now') - {_changeLogDays}")
+
+
+def hasSpatialIndex(db: sqlite3.Connection) -> bool:
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name == 'aerialBounds'").fetchone() is not None
+
+
+def _createAerialsTable(db: sqlite3.Connection) -> None:
+    db.execute('''
+        CREATE TABLE aerials
+        (
+            id TEXT PRIMARY KEY NOT NULL,  -- <sortie>/<bildnr>.ecw
+            usage INT NOT NULL REFERENCES usages(id),
+            -- Scene coordinates.
+            posX REAL NOT NULL,
+            posY REAL NOT NULL,
+            -- Affine transform, as in QTransform.
+            m11 REAL NOT NULL,
+            m12 REAL NOT NULL,
+            m21 REAL NOT NULL,
+            m22 REAL NOT NULL,
+            dx REAL NOT NULL,
+            dy REAL NOT NULL,
+            trafoLocked INT NOT NULL DEFAULT 0,
+            path TEXT,                     -- Relative to imageRootDir if previewLeft is NULL else to previewRootDir.
+            previewLeft INT CHECK(previewLeft ISNULL OR path NOTNULL),
+            previewTop INT,
+            previewWidth INT,
+            previewHeight INT,
+            previewRotationCcw INT,        -- In multiples of 90°.
+            sortie TEXT,
+            bildnr INT,
+            datum TEXT,                    -- ISO 8601
+            masstab INT,
+            lbdb INT,
+            meta TEXT NOT NULL,            -- JSON of the spreadsheet row.
+            -- Raster meta data of the image file, if any. Pre-scanned during loading, so ECWs need not be opened for it.
+            rasterWidth INT,
+            rasterHeight INT,
+            bandCount INT,
+            overviewCount INT,
+            fileSize INT
+        ) ''')
+
+
+def _migrateFromJson(db: sqlite3.Connection) -> None:
+    logger.info(f'Upgrading the data base to schema version {_schemaVersion}.')
+    # Data bases of even older versions lack the raster meta data.
+    columns = {name for _, name, *_ in db.execute('PRAGMA table_info(aerials)')}
+    rasterColumns = ', '.join(column if column in columns else 'NULL' for column in _rasterMetaColumns.values())
+    db.execute('BEGIN TRANSACTION')
+    try:
+        db.execute('ALTER TABLE aerials RENAME TO aerialsJson')
+        _createAerialsTable(db)
+        rows = []
+        for imgId, usage, scenePos, trafo, trafoLocked, path, previewRect, meta, *rasterMeta in db.execute(
+                f'SELECT id, usage, scenePos, trafo, trafoLocked, path, previewRect, meta, {rasterColumns} FROM aerialsJson'):
+            m11, m12, _, m21, m22, _, dx, dy, _ = json.loads(trafo)
+            rows.append((imgId, usage, *json.loads(scenePos), m11, m12, m21, m22, dx, dy, trafoLocked, path,
+                         *(json.loads(previewRect) if previewRect else [None] * len(PreviewRect._fields)),
+                         *_normalizedMeta(json.loads(meta)), meta, *rasterMeta))
+        db.executemany(f"INSERT INTO aerials ({', '.join(_aerialColumns)}) VALUES({', '.join('?' * len(_aerialColumns))})", rows)
+        db.execute('DROP TABLE aerialsJson')
+        db.execute(f'PRAGMA user_version = {_schemaVersion}')
+        db.execute('COMMIT TRANSACTION')
+    except:
+        db.execute('ROLLBACK TRANSACTION')
+        raise
+
+
+def _normalizedMeta(meta: dict) -> list:
+    # Values of a spreadsheet row, or of its JSON.
+    values = []
+    for name in _metaColumns:
+        value = meta.get(name)
+        if isinstance(value, datetime.date):
+            value = value.isoformat()
+        values.append(value)
+    return values
+
+
+def fetchAerials(db: sqlite3.Connection, imgIds: Iterable[str] | None = None) -> dict[str, StoredAerial]:
+    """The state of all aerials stored in db, or of those with the given ids, read with a single query."""
+    columns = ', '.join(_rasterMetaColumns.values())
+    query = f'''
+        SELECT id, usage, posX, posY, m11, m12, m21, m22, dx, dy, trafoLocked, path,
+               previewLeft, previewTop, previewWidth, previewHeight, previewRotationCcw, {columns}
+        FROM aerials'''
+    if imgIds is not None:
+        # Not as bound parameters, whose number is limited.
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS fetchedIds (id TEXT PRIMARY KEY)')
+        db.execute('DELETE FROM fetchedIds')
+        db.executemany('INSERT OR IGNORE INTO fetchedIds (id) VALUES (?)', ((imgId,) for imgId in imgIds))
+        query += ' WHERE id IN fetchedIds'
+    stored = {}
+    for imgId, usage, x, y, m11, m12, m21, m22, dx, dy, trafoLocked, path, *values in db.execute(query):
+        previewRect, rasterMeta = values[:len(PreviewRect._fields)], values[len(PreviewRect._fields):]
+        stored[imgId] = StoredAerial(Usage(usage), (x, y), (m11, m12, m21, m22, dx, dy), bool(trafoLocked), path,
+                                     None if previewRect[0] is None else PreviewRect(*previewRect),
+                                     None if rasterMeta[0] is None else RasterMeta(*rasterMeta))
+    return stored
+
+
+def insertAerials(db: sqlite3.Connection, aerials: Iterable[tuple[str, StoredAerial, object]]) -> None:
+    """Insert new aerials, given as their ids, states, and rows of the spreadsheet, with a single statement."""
+    def toJson(value):
+        if isinstance(value, datetime.date):
+            return str(value)
+        raise TypeError(f'Unable to encode type {value.__class__}')
+
+    db.executemany(
+        f"INSERT OR IGNORE INTO aerials ({', '.join(_aerialColumns)}) VALUES({', '.join('?' * len(_aerialColumns))})",
+        ((imgId, aerial.usage, *aerial.scenePos, *aerial.trafo, aerial.trafoLocked, aerial.path,
+          *(aerial.previewRect or [None] * len(PreviewRect._fields)),
+          *_normalizedMeta(meta._asdict()), json.dumps(meta._asdict(), default=toJson),
+          *(aerial.rasterMeta or [None] * len(_rasterMetaColumns)))
+         for imgId, aerial, meta in aerials))
+
+
+def storeRasterMetas(db: sqlite3.Connection, rasterMetas: dict[str, RasterMeta]) -> None:
+    assignments = ', '.join(f'{column} = ?' for column in _rasterMetaColumns.values())
+    db.executemany(f'UPDATE aerials SET {assignments} WHERE id == ?',
+                   ((*rasterMeta, imgId) for imgId, rasterMeta in rasterMetas.items()))
+
+
+class ChangeFeed:
+    """Tell which aerials other connections have changed since the last poll.
+
+    PRAGMA data_version detects the commits of other computers only if the data base is not in journal mode WAL,
+    which needs all connections to be on the same computer. connect warns about data bases on network drives in WAL mode.
+    """
+
+    def __init__(self, db: sqlite3.Connection) -> None:
+        self.__db: Final = db
+        self.__dataVersion = self.__currentDataVersion()
+        self.__lastSeq: int = db.execute('SELECT IFNULL(MAX(seq), 0) FROM aerialChanges').fetchone()[0]
+
+    def poll(self) -> dict[str, StoredAerial]:
+        """The current state of the aerials changed since the last poll, including some changed by this connection."""
+        # data_version changes only if another connection has committed. Cheap, as it needs no access to the data base file.
+        dataVersion = self.__currentDataVersion()
+        if dataVersion == self.__dataVersion:
+            return {}
+        self.__dataVersion = dataVersion
+        changes = self.__db.execute('SELECT seq, id FROM aerialChanges WHERE seq > ?', [self.__lastSeq]).fetchall()
+        if not changes:
+            return {}
+        self.__lastSeq = max(seq for seq, _ in changes)
+        return fetchAerials(self.__db, {imgId for _, imgId in changes})
+
+    def __currentDataVersion(self) -> int:
+        return self.__db.execute('PRAGMA data_version').fetchone()[0]
+
+
+class WriteBehind:
+    """Coalesce changes of aerials in memory, and store them in a single transaction when flushed.
+
+    Dragging or zooming an aerial changes its position and transform many times per second,
+    while each commit may take long on a network drive.
+    """
+
+    def __init__(self, db: sqlite3.Connection, onPending: Callable[[], None]) -> None:
+        self.db: Final = db
+        # Called when the first change gets pending after a flush, e.g. to schedule the next one.
+        self.__onPending: Final = onPending
+        # id -> column -> value
+        self.__pending: dict[str, dict[str, object]] = {}
+        # id -> left, top, right, bottom
+        self.__pendingBounds: dict[str, tuple[float, float, float, float]] = {}
+
+    def update(self, imgId: str, **columns) -> None:
+        wasEmpty = self.__isEmpty()
+        self.__pending.setdefault(imgId, {}).update(columns)
+        if wasEmpty:
+            self.__onPending()
+
+    def isPending(self, imgId: str) -> bool:
+        return imgId in self.__pending or imgId in self.__pendingBounds
+
+    def write(self, imgId: str, **columns) -> None:
+        """Store changes at once, superseding pending ones of the same columns."""
+        if pendingColumns := self.__pending.get(imgId):
+            for name in columns:
+                pendingColumns.pop(name, None)
+            if not pendingColumns:
+                del self.__pending[imgId]
+        self.db.execute(f"UPDATE aerials SET {', '.join(f'{name} = ?' for name in columns)} WHERE id == ?",
+                        [*columns.values(), imgId])
+
+    def updateBounds(self, imgId: str, bounds: tuple[float, float, float, float]) -> None:
+        wasEmpty = self.__isEmpty()
+        self.__pendingBounds[imgId] = bounds
+        if wasEmpty:
+            self.__onPending()
+
+    def flush(self) -> None:
+        if self.__isEmpty():
+            return
+        pending, self.__pending = self.__pending, {}
+        pendingBounds, self.__pendingBounds = self.__pendingBounds, {}
+        # One statement per combination of changed columns.
+        rows: dict[tuple[str, ...], list] = {}
+        for imgId, columns in pending.items():
+            rows.setdefault(tuple(columns), []).append((*columns.values(), imgId))
+        try:
+            self.db.execute('BEGIN TRANSACTION')
+            try:
+                for names, values in rows.items():
+                    self.db.executemany(f"UPDATE aerials SET {', '.join(f'{name} = ?' for name in names)} WHERE id == ?", values)
+                storeBounds(self.db, pendingBounds.items())
+                self.db.execute('COMMIT TRANSACTION')
+            except:
+                self.db.execute('ROLLBACK TRANSACTION')
+                raise
+        except sqlite3.Error as ex:
+            # E.g. locked by another process for longer than the busy timeout. Try again later, without losing newer changes.
+            logger.warning(f'Failed to store the changes of {len(pending)} aerials: {ex}')
+            for imgId, columns in self.__pending.items():
+                pending.setdefault(imgId, {}).update(columns)
+            self.__pending = pending
+            self.__pendingBounds = pendingBounds | self.__pendingBounds
+            self.__onPending()
+
+    def __isEmpty(self) -> bool:
+        return not self.__pending and not self.__pendingBounds
+
+
+def storeBounds(db: sqlite3.Connection, bounds: Iterable[tuple[str, tuple[float, float, float, float]]]) -> None:
+    """Update the spatial index, given ids with the left, top, right, and bottom bounds of their images in scene coordinates."""
+    if not hasSpatialIndex(db):
+        return
+    db.executemany(
+        'INSERT OR REPLACE INTO aerialBounds (id, minX, maxX, minY, maxY) SELECT rowid, ?, ?, ?, ? FROM aerials WHERE id == ?',
+        ((left, right, top, bottom, imgId) for imgId, (left, top, right, bottom) in bounds))
+
+
+def intersecting(db: sqlite3.Connection, left: float, top: float, right: float, bottom: float) -> list[str]:
+    """The ids of aerials whose images intersect the given rectangle in scene coordinates. Needs the spatial index.
+
+    For a point, pass it as both corners. For an area of interest, pass its bounding rectangle.
+    """
+    return [imgId for imgId, in db.execute('''
+        SELECT aerials.id
+        FROM aerialBounds JOIN aerials ON aerials.rowid == aerialBounds.id
+        WHERE minX <= ? AND maxX >= ? AND minY <= ? AND maxY >= ?''', [right, left, bottom, top])]
+
+
+def itemSize(previewRect: PreviewRect | None, rasterSize: tuple[int, int] | None) -> tuple[float, float]:
+    """The logical size of an aerial's image item, given its preview, or otherwise the size of its raster, if any."""
+    if previewRect is not None:
+        width, height, rotation = previewRect[2:]
+        if rotation % 2:
+            width, height = height, width
+    elif rasterSize is not None:
+        width, height = rasterSize
+    else:
+        width, height = pixMapWidth, pixMapWidth
+    # As the pixmap that gets read for it.
+    return float(pixMapWidth), float(round(height / width * pixMapWidth))
+
+
+def itemBounds(scenePos: tuple[float, float], trafo: tuple[float, ...], size: tuple[float, float]) -> tuple[float, float, float, float]:
+    """The left, top, right, and bottom bounds in scene coordinates of an image item of size, centered on its origin."""
+    m11, m12, m21, m22, dx, dy = trafo
+    xs, ys = [], []
+    for x, y in (-1, -1), (1, -1), (1, 1), (-1, 1):
+        x, y = x * size[0] / 2, y * size[1] / 2
+        # Like QTransform.map, followed by the position.
+        xs.append(m11 * x + m21 * y + dx + scenePos[0])
+        ys.append(m12 * x + m22 * y + dy + scenePos[1])
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def originalTrafo(radiusBild: float, scaleCartesian2map: float) -> tuple[float, ...]:
+    """The transform of an aerial before it has been moved, as stored in the DB."""
+    scale = radiusBild * scaleCartesian2map / (pixMapWidth / 2)
+    # Actually, 2 times this scale seems a bit closer to the true scale.
+    return scale, 0., 0., scale, 0., 0.
@@ -0,0 +1,137 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Cache the cleaned aerial meta data of a spreadsheet in a columnar format.
+
+Parsing large LBDB exports takes tens of seconds, while reading a Feather file of the same data takes milliseconds.
+Feather needs pyarrow. Without it, fall back to pickle.
+The cache is valid as long as the spreadsheet has the same size, and either the same modification time or the same content.
+"""
+from __future__ import annotations
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    featherAvailable = False
+else:
+    featherAvailable = True
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Final, NamedTuple
+
+logger: Final = logging.getLogger(__name__)
+
+
+class CachedSpreadsheet(NamedTuple):
+    df: pd.DataFrame
+    sheetName: str
+    projectName: str
+
+
+class SpreadsheetCache:
+
+    __version: Final = 1
+
+    def __init__(self, fileName: Path, cacheStem: Path) -> None:
+        self.__fileName: Final = fileName
+        self.__keyPath: Final = cacheStem.with_name(cacheStem.name + '.json')
+        self.__dataPaths: Final = {'feather': cacheStem.with_name(cacheStem.name + '.feather'),
+                                   'pickle': cacheStem.with_name(cacheStem.name + '.pkl')}
+        stat = fileName.stat()
+        self.__size: Final = stat.st_size
+        self.__mtimeNs: Final = stat.st_mtime_ns
+        self.__sha256: str | None = None
+
+    def load(self) -> CachedSpreadsheet | None:
+        try:
+            with self.__keyPath.open(encoding='utf-8') as fin:
+                key = json.load(fin)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as ex:
+            logger.warning(f'Ignoring the spreadsheet cache {self.__keyPath}: {ex}')
+            return None
+        if key.get('version') != __class__.__version or key.get('size') != self.__size:
+            return None
+        if key.get('mtimeNs') != self.__mtimeNs and key.get('sha256') != self.__contentHash():
+            return None
+        fmt = key.get('format')
+        if fmt == 'feather' and not featherAvailable:
+            return None
+        dataPath = self.__dataPaths.get(fmt)
+        if dataPath is None:
+            return None
+        try:
+            df = pd.read_feather(dataPath) if fmt == 'feather' else pd.read_pickle(dataPath)
+        except Exception as ex:
+            logger.warning(f'Ignoring the spreadsheet cache {dataPath}: {ex}')
+            return None
+        logger.info(f'Aerial meta data of {self.__fileName} read from cache {dataPath}.')
+        if key['mtimeNs'] != self.__mtimeNs:
+            # Same content, e.g. copied. Spare hashing next time.
+            try:
+                self.__storeKey(fmt, key['sheetName'], key['projectName'])
+            except OSError:
+                pass
+        return CachedSpreadsheet(df, key['sheetName'], key['projectName'])
+
+    def store(self, cached: CachedSpreadsheet) -> None:
+        # Feather needs a default index.
+        df = cached.df.reset_index(drop=True)
+        fmt = 'pickle'
+        try:
+            if featherAvailable:
+                try:
+                    __class__.__write(self.__dataPaths['feather'], df.to_feather)
+                except (pyarrow.ArrowException, ValueError, TypeError) as ex:
+                    # E.g. columns with values of mixed types.
+                    logger.info(f'Falling back to pickle for caching {self.__fileName}: {ex}')
+                else:
+                    fmt = 'feather'
+            if fmt == 'pickle':
+                __class__.__write(self.__dataPaths['pickle'], df.to_pickle)
+            self.__storeKey(fmt, cached.sheetName, cached.projectName)
+        except OSError as ex:
+            logger.warning(f'Failed to cache the aerial meta data of {self.__fileName}: {ex}')
+
+    def __storeKey(self, fmt: str, sheetName: str, projectName: str) -> None:
+        key = {'version': __class__.__version, 'size': self.__size, 'mtimeNs': self.__mtimeNs, 'sha256': self.__contentHash(),
+               'format': fmt, 'sheetName': sheetName, 'projectName': projectName}
+        # Write the key last, so it never refers to incomplete data.
+        __class__.__write(self.__keyPath, lambda path: path.write_text(json.dumps(key), encoding='utf-8'))
+
+    def __contentHash(self) -> str:
+        if self.__sha256 is None:
+            sha256 = hashlib.sha256()
+            with self.__fileName.open('rb') as fin:
+                while chunk := fin.read(2 ** 20):
+                    sha256.update(chunk)
+            self.__sha256 = sha256.hexdigest()
+        return self.__sha256
+
+    @staticmethod
+    def __write(path: Path, write) -> None:
+        tmpPath = path.with_name(path.name + '.tmp')
+        write(tmpPath)
+        tmpPath.replace(path)
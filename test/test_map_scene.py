@@ -0,0 +1,50 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from qgis.PyQt.QtCore import QRectF
+from qgis.PyQt.QtWidgets import QApplication
+
+import configparser
+
+import pytest
+
+from .. import map_scene
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_occlusionCulledOnlyAfterChanges(app, monkeypatch):
+    rects = []
+    monkeypatch.setattr(map_scene, 'cullOccludedImages', lambda images, rect: rects.append(rect))
+    scene = map_scene.MapScene(0., 0., 1000., 1000., epsg=3857, config=configparser.ConfigParser())
+
+    def paintEvent(exposed: QRectF, viewed: QRectF = QRectF(400., 400., 200., 200.)) -> None:
+        # As MapView.paintEvent does.
+        scene.setViewedRect(viewed)
+        scene.cullOccludedImages(exposed)
+
+    paintEvent(QRectF(400., 400., 200., 200.))
+    assert len(rects) == 1
+    # Repaints of the whole view, or of a hovered or blinking aerial, or after panning a bit.
+    paintEvent(QRectF(400., 400., 200., 200.))
+    paintEvent(QRectF(450., 450., 10., 10.))
+    paintEvent(QRectF(420., 420., 200., 200.), QRectF(420., 420., 200., 200.))
+    assert len(rects) == 1
+    scene.invalidateOcclusion()
+    paintEvent(QRectF(400., 400., 200., 200.))
+    assert len(rects) == 2
+    # Zoomed out beyond the rect culled before.
+    paintEvent(QRectF(0., 0., 1000., 1000.), QRectF(0., 0., 1000., 1000.))
+    assert len(rects) == 3
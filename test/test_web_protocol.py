@@ -0,0 +1,54 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+import numpy as np
+
+import collections
+import json
+
+import pytest
+
+from ..aerial_table import AerialTable
+from ..web_protocol import AerialsFeed
+
+
+def _strictLoads(text: str):
+    # Like JSON.parse in the web view.
+    def reject(constant):
+        raise ValueError(f'Not JSON: {constant}')
+    return json.loads(text, parse_constant=reject)
+
+
+def _table(ids: list[str]) -> AerialTable:
+    Meta = collections.namedtuple('Meta', 'Radius_Bild')
+    return AerialTable(ids, [Meta(100.)] * len(ids), np.zeros((len(ids), 2)), [None] * len(ids))
+
+
+def test_snapshotWithNanMeta():
+    # Blank cells of the spreadsheet.
+    metas = [('a.ecw', {'Bildnr': float('nan'), 'MASSTAB': 20000}),
+             ('b.ecw', {'Bildnr': 3, 'MASSTAB': float('inf')})]
+    snapshot = _strictLoads(AerialsFeed().snapshot(_table(['a.ecw', 'b.ecw']), lambda: metas))
+    assert snapshot['columns']['id'] == ['a.ecw', 'b.ecw']
+    assert snapshot['meta'] == {'Bildnr': [None, 3], 'MASSTAB': [20000, None]}
+
+
+def test_deltaWithNanFootprint():
+    feed = AerialsFeed()
+    feed.snapshot(_table(['a.ecw']), lambda: [('a.ecw', {})])
+    feed.changeFootprint('a.ecw', [{'x': float('nan'), 'y': 1.}] * 4)
+    delta = _strictLoads(feed.takeDelta())
+    assert delta['changes']['a.ecw']['footprint'] == [None, 1.] * 4
+
+
+def test_nanOutsideOfMetaFailsLoudly():
+    feed = AerialsFeed()
+    feed.change('a.ecw', usage=float('nan'))
+    with pytest.raises(ValueError):
+        feed.takeDelta()
@@ -0,0 +1,108 @@
+#  ***************************************************************************
+#  *                                                                         *
+#  *   This program is free software; you can redistribute it and/or modify  *
+#  *   it under the terms of the GNU General Public License as published by  *
+#  *   the Free Software Foundation; either version 2 of the License, or     *
+#  *   (at your option) any later version.                                   *
+#  *                                                                         *
+#  ***************************************************************************
+
+"""
+/***************************************************************************
+ SelORecon
+                                 A QGIS plugin
+ Guided selection and orientation of aerial reconnaissance images.
+                              -------------------
+        copyright            : (C) 2021 by Photogrammetry @ GEO, TU Wien, Austria
+        email                : wilfried.karel@geo.tuwien.ac.at
+ ***************************************************************************/
+
+Encode the state of aerials for the web view.
+
+The Qt WebKit Bridge converts lists of dicts element by element to QVariant and JavaScript objects.
+Hence, aerials are sent as single JSON strings instead:
+first a snapshot of all aerials, with one array per column, and then only deltas keyed by aerial id.
+Each delta names the revision it is based on, so the page can tell if it has missed one, and ask for a new snapshot.
+VisAnPrototype/communication.js decodes them.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from collections.abc import Callable, Iterable
+import json
+import logging
+import math
+from typing import Any, Final
+
+from .aerial_table import AerialTable
+
+logger: Final = logging.getLogger(__name__)
+
+# Increment on incompatible changes, together with aerialsProtocol in communication.js.
+protocolVersion: Final = 1
+
+# Of footprint coordinates [m].
+_decimals: Final = 2
+
+
+def _dumps(obj) -> str:
+    # JSON.parse rejects NaN and Infinity, so fail here instead.
+    return json.dumps(obj, separators=(',', ':'), allow_nan=False)
+
+
+def _finite(value):
+    # Blank cells of the spreadsheet have become NaN.
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+class AerialsFeed:
+    """Snapshots and deltas of the aerials of a project."""
+
+    def __init__(self) -> None:
+        self.__revision = 0
+        self.__pending: Final[dict[str, dict[str, Any]]] = {}
+        # The meta data of aerials never changes, so encode it only once per number of rows, which grows while batches get loaded.
+        self.__metaJson: tuple[int, str] | None = None
+
+    def reset(self) -> None:
+        """Forget the aerials of the previous project."""
+        self.__pending.clear()
+        self.__metaJson = None
+        # Keep counting, so a page still at a revision of the previous project requests a snapshot.
+        self.__revision += 1
+
+    def snapshot(self, table: AerialTable, readMetas: Callable[[], Iterable[tuple[str, dict]]]) -> str:
+        """All aerials of table, with their meta data as stored in the DB. readMetas gets called only if rows have been added since the last snapshot."""
+        if self.__metaJson is None or self.__metaJson[0] != len(table):
+            metaOf = dict(readMetas())
+            ordered = [metaOf[imgId] for imgId in table.ids]
+            names = list(ordered[0]) if ordered else []
+            self.__metaJson = len(table), _dumps({name: [_finite(meta.get(name)) for meta in ordered] for name in names})
+        # The snapshot includes all changes so far.
+        self.__pending.clear()
+        columns = _dumps({
+            'id': table.ids,
+            'usage': table.usage.tolist(),
+            'trafoLocked': table.locked.tolist(),
+            'path': table.paths,
+            'availability': table.availability.tolist(),
+            # 8 coordinates per aerial.
+            'footprint': [_finite(coord) for coord in np.round(table.footprints, _decimals).ravel().tolist()]})
+        return f'{{"protocol":{protocolVersion},"revision":{self.__revision},"columns":{columns},"meta":{self.__metaJson[1]}}}'
+
+    def change(self, imgId: str, **fields) -> None:
+        """Record changes of an aerial. Later changes of the same fields replace earlier ones."""
+        self.__pending.setdefault(imgId, {}).update(fields)
+
+    def changeFootprint(self, imgId: str, footprint: list[dict[str, float]]) -> None:
+        self.change(imgId, footprint=[_finite(round(coord, _decimals)) for corner in footprint for coord in (corner['x'], corner['y'])])
+
+    def takeDelta(self) -> str | None:
+        """The changes recorded since the last snapshot or delta, if any."""
+        if not self.__pending:
+            return None
+        delta = _dumps({'protocol': protocolVersion, 'revision': self.__revision + 1, 'base': self.__revision, 'changes': self.__pending})
+        self.__revision += 1
+        self.__pending.clear()
+        return delta
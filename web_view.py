@@ -45,17 +45,16 @@ httpdLogger = logging.getLogger(__name__ + '.httpd')
 class WebView(QWebView):
 
     # inbound
-    aerialsLoaded = pyqtSignal(list)
+    aerialsSnapshot = pyqtSignal(str)
+    aerialsDelta = pyqtSignal(str)
     attackDataLoaded = pyqtSignal(list)
     areaOfInterestLoaded = pyqtSignal(list)
-    aerialFootPrintChanged = pyqtSignal(str, list)
-    aerialAvailabilityChanged = pyqtSignal(str, int, str)
-    aerialUsageChanged = pyqtSignal(str, int)
 
     # outbound
     filterAerials = pyqtSignal(set)
     highlightAerials = pyqtSignal(set)
     showAsImage = pyqtSignal(str, bool)
+    requestAerialsSnapshot = pyqtSignal()
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -90,16 +89,15 @@ class WebView(QWebView):
 
         frame.javaScriptWindowObjectCleared.connect(self.__onWebJavaScriptWindowObjectCleared)
 
-        self.aerialsLoaded.connect(self.__exposedToWebJavaScript.aerialsLoaded)
+        self.aerialsSnapshot.connect(self.__exposedToWebJavaScript.aerialsSnapshot)
+        self.aerialsDelta.connect(self.__exposedToWebJavaScript.aerialsDelta)
         self.attackDataLoaded.connect(self.__exposedToWebJavaScript.attackDataLoaded)
         self.areaOfInterestLoaded.connect(self.__exposedToWebJavaScript.areaOfInterestLoaded)
-        self.aerialFootPrintChanged.connect(self.__exposedToWebJavaScript.aerialFootPrintChanged)
-        self.aerialAvailabilityChanged.connect(self.__exposedToWebJavaScript.aerialAvailabilityChanged)
-        self.aerialUsageChanged.connect(self.__exposedToWebJavaScript.aerialUsageChanged)
 
         self.__exposedToWebJavaScript.filterAerials.connect(self.__filterAerials)
         self.__exposedToWebJavaScript.highlightAerials.connect(self.__highlightAerials)
         self.__exposedToWebJavaScript.showAsImage.connect(self.showAsImage)
+        self.__exposedToWebJavaScript.requestAerialsSnapshot.connect(self.requestAerialsSnapshot)
 
         assert self.__httpd is not None
         #self.setUrl(QUrl.fromLocalFile(str(Path(__file__).parent / 'VisAnPrototype/index.html')))
@@ -223,14 +221,15 @@ class WebPage(QWebPage):
 class ExposedToWebJavaScript(QObject):
 
     # PlugIn -> Browser
-    aerialsLoaded = pyqtSignal(list)
+    # JSON, see web_protocol.
+    aerialsSnapshot = pyqtSignal(str)
+    aerialsDelta = pyqtSignal(str)
     attackDataLoaded = pyqtSignal(list)
     areaOfInterestLoaded = pyqtSignal(list)
-    aerialFootPrintChanged = pyqtSignal(str, list)
-    aerialAvailabilityChanged = pyqtSignal(str, int, str)
-    aerialUsageChanged = pyqtSignal(str, int)
 
     # Browser -> PlugIn
     filterAerials = pyqtSignal(list)
     highlightAerials = pyqtSignal(list)
     showAsImage = pyqtSignal(str, bool)
+    # Having missed a delta.
+    requestAerialsSnapshot = pyqtSignal()